@@ -141,7 +141,7 @@ def run_experiment(experiment_, render = True, interactive = True, console_outpu
         event_manager.register_listener(main_view)
 
     # Initialize the website trace history view.
-    trace_view = agentevents.AgentEvents()
+    trace_view = agentevents.AgentEvents(experiment_.trace_size)
     event_manager.register_listener(trace_view)
 
     # Initialize and register the controller.
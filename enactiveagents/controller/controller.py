@@ -157,8 +157,6 @@ class Controller(events.EventListener):
         """
         Save all agents to files.
         """
-        import json
-        import utilities.customjsonencoder
         try:
             import dill
         except ImportError:
@@ -196,7 +194,7 @@ class Controller(events.EventListener):
 
                 print " - Saving %s to %s" % (agent.get_name(), file_path)
                 with open(file_path, 'w') as f:
-                    json.dump(agent, f, cls=utilities.customjsonencoder.CustomJSONEncoder, indent=4, sort_keys=True)
+                    agent.write_json(f)
             
             file_name = "%s - %s.p" % (strftime("%Y%m%dT%H%M%S"), agent.get_name())
             file_path = os.path.join(settings.AGENT_DIR, file_name)
@@ -167,9 +167,6 @@ class BasicCoexsistenceExperiment(experiment.Experiment):
     def __init__(self):
         super(BasicCoexsistenceExperiment, self).__init__()
 
-        # Parse world
-        self.world = self.parse_world(self.world_representation)
-
         # Register the previously defined functions.
         enact_logic = Elements.get_enact_logic()
 
@@ -197,11 +194,15 @@ class BasicCoexsistenceExperiment(experiment.Experiment):
         motivation[Elements.cuddle] = 50
         motivation[Elements.cuddle_fail] = -1
 
+        # Let the agents share the primitives and motivation values
+        self.share_interaction_memory(primitives, motivation)
+
+        # Parse world
+        self.world = self.parse_world(self.world_representation)
+
         for entity in self.world.get_entities():
             if isinstance(entity, model.agent.Agent):
                 self.world.add_enact_logic(entity, enact_logic)
-                entity.add_primitives(primitives)
-                entity.add_motivations(motivation)
 
 class BasicVisionExperiment(experiment.Experiment):
     world_representation = [
@@ -436,9 +437,6 @@ class BasicVisionCoexsistenceExperiment(experiment.Experiment):
     def __init__(self):
         super(BasicVisionCoexsistenceExperiment, self).__init__()
 
-        # Parse world
-        self.world = self.parse_world(self.world_representation)
-
         # Register the previously defined functions.
         enact_logic = Elements.get_enact_logic()
 
@@ -462,11 +460,15 @@ class BasicVisionCoexsistenceExperiment(experiment.Experiment):
         motivation[Elements.cuddle] = 50
         motivation[Elements.cuddle_fail] = -1
 
+        # Let the agents share the primitives and motivation values
+        self.share_interaction_memory(primitives, motivation)
+
+        # Parse world
+        self.world = self.parse_world(self.world_representation)
+
         for entity in self.world.get_entities():
             if isinstance(entity, model.agent.Agent):
                 self.world.add_enact_logic(entity, enact_logic)
-                entity.add_primitives(primitives)
-                entity.add_motivations(motivation)
 
 class BasicVisionCoexsistenceDestroyExperiment(experiment.Experiment):
     world_representation = [
@@ -488,8 +490,8 @@ class BasicVisionCoexsistenceDestroyExperiment(experiment.Experiment):
         self.world.add_entity(a)
 
         # Set up primitives
-        collaborative_destroy = model.interaction.PrimitiveInteraction("Collaborative Destroy", "Succeed")
-        collaborative_destroy_fail = model.interaction.PrimitiveInteraction("Collaborative Destroy", "Fail")
+        collaborative_destroy = model.interaction.get_primitive_interaction("Collaborative Destroy", "Succeed")
+        collaborative_destroy_fail = model.interaction.get_primitive_interaction("Collaborative Destroy", "Fail")
 
         def _collaborative_destroy(world, agents_interactions):
             enacted = {}
@@ -576,5 +578,5 @@ class BasicVisionCoexsistenceDestroyExperiment(experiment.Experiment):
             elif event.key == pygame.K_b:
                 block = model.structure.Block()
                 block.set_position(coords)
-                block.height = 2
+                block.set_height(2)
                 self.world.add_entity(block)
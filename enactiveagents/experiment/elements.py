@@ -5,21 +5,21 @@ Module containing some re-usable experiment elements
 import model
 
 class Elements:
-    step = model.interaction.PrimitiveInteraction("Step", "Succeed")
-    step_fail = model.interaction.PrimitiveInteraction("Step", "Fail")
-    turn_right = model.interaction.PrimitiveInteraction("Turn Right", "Succeed")
-    turn_left = model.interaction.PrimitiveInteraction("Turn Left", "Succeed")
-    wait = model.interaction.PrimitiveInteraction("Wait", "Succeed")
-    feel = model.interaction.PrimitiveInteraction("Feel", "Succeed")
-    feel_fail = model.interaction.PrimitiveInteraction("Feel", "Fail")
-    cuddle = model.interaction.PrimitiveInteraction("Cuddle", "Succeed")
-    cuddle_fail = model.interaction.PrimitiveInteraction("Cuddle", "Fail")
-    eat = model.interaction.PrimitiveInteraction("Eat", "Succeed")
-    eat_fail = model.interaction.PrimitiveInteraction("Eat", "Fail")
-    push = model.interaction.PrimitiveInteraction("Push", "Succeed")
-    push_fail = model.interaction.PrimitiveInteraction("Push", "Fail")
-    destroy = model.interaction.PrimitiveInteraction("Destroy", "Succeed")
-    destroy_fail = model.interaction.PrimitiveInteraction("Destroy", "Fail")
+    step = model.interaction.get_primitive_interaction("Step", "Succeed")
+    step_fail = model.interaction.get_primitive_interaction("Step", "Fail")
+    turn_right = model.interaction.get_primitive_interaction("Turn Right", "Succeed")
+    turn_left = model.interaction.get_primitive_interaction("Turn Left", "Succeed")
+    wait = model.interaction.get_primitive_interaction("Wait", "Succeed")
+    feel = model.interaction.get_primitive_interaction("Feel", "Succeed")
+    feel_fail = model.interaction.get_primitive_interaction("Feel", "Fail")
+    cuddle = model.interaction.get_primitive_interaction("Cuddle", "Succeed")
+    cuddle_fail = model.interaction.get_primitive_interaction("Cuddle", "Fail")
+    eat = model.interaction.get_primitive_interaction("Eat", "Succeed")
+    eat_fail = model.interaction.get_primitive_interaction("Eat", "Fail")
+    push = model.interaction.get_primitive_interaction("Push", "Succeed")
+    push_fail = model.interaction.get_primitive_interaction("Push", "Fail")
+    destroy = model.interaction.get_primitive_interaction("Destroy", "Succeed")
+    destroy_fail = model.interaction.get_primitive_interaction("Destroy", "Fail")
 
     @classmethod
     def get_enact_logic(cls):
@@ -92,7 +92,7 @@ class Elements:
             entities = world.get_entities_in_front(agent)
             for entity in entities:
                 if isinstance(entity, model.structure.Block):
-                    entity.position.add(agent.get_move_delta(1))
+                    entity.add_position(agent.get_move_delta(1))
                     return Elements.push
         return cls.push_fail
 
@@ -5,6 +5,8 @@ import settings
 import model.world
 import model.structure
 import model.agent
+import model.interactionmemory
+import model.boredomhandler
 import model.perceptionhandler
 
 class Experiment(object):
@@ -12,6 +14,24 @@ class Experiment(object):
     controller = None
     world = None
 
+    #: The number of interactions kept in the interaction history of the 
+    #: agents' interaction memories, or None for the default.
+    interaction_history_size = None
+    #: The number of enacted interactions kept in the history of constructive
+    #: agents, or None for the default.
+    agent_history_size = None
+    #: The number of recent interactions compared with by the repetitive 
+    #: boredom handlers of the agents' interaction memories, or None for the
+    #: default.
+    boredom_history_size = None
+    #: The number of prepared and enacted interactions per agent kept in the
+    #: trace view.
+    trace_size = 20
+    #: The interaction memory shared by the constructive agents created by the
+    #: mapper, or None if every agent has its own memory. Set by 
+    #: share_interaction_memory.
+    shared_interaction_memory = None
+
     def parse_world(self, world_repr, mapper=None):
         """
         Parse a representation of a world to a world.
@@ -25,6 +45,7 @@ class Experiment(object):
             mapper = self.mapper
 
         world = model.world.World()
+        world.add_entity_added_callback(self.entity_added)
 
         max_y = 0
         max_x = 0
@@ -59,11 +80,11 @@ class Experiment(object):
         elif symbol == "b":
             return model.structure.Block()
         elif symbol == "a":
-            return model.agent.ConstructiveAgent()
+            return self.setup_agent_interaction_memory(model.agent.ConstructiveAgent())
         elif symbol == "h":
             return model.agent.HomeostaticConstructiveAgent()
         elif symbol == "p":
-            a = model.agent.ConstructiveAgent()
+            a = self.setup_agent_interaction_memory(model.agent.ConstructiveAgent())
             a.set_perception_handler(model.perceptionhandler.PersistentPerceptionHandler())
             return a
         elif symbol == "u":
@@ -73,6 +94,79 @@ class Experiment(object):
         else:
             return None
 
+    def entity_added(self, world, entity):
+        """
+        Called when an entity is added to a world parsed by this experiment.
+
+        :param world: The world the entity was added to.
+        :param entity: The added entity.
+        """
+        if isinstance(entity, model.agent.Agent):
+            self.setup_agent_histories(entity)
+
+    def setup_agent_histories(self, agent):
+        """
+        Set the sizes of the history windows of an agent, as configured by 
+        interaction_history_size, agent_history_size and 
+        boredom_history_size. Called for every agent added to a world parsed
+        by this experiment.
+
+        :param agent: The agent to set up.
+        """
+        if self.interaction_history_size is not None:
+            agent.get_interaction_memory().set_interaction_history_size(self.interaction_history_size)
+        if self.agent_history_size is not None and isinstance(agent, model.agent.ConstructiveAgent):
+            agent.set_history_size(self.agent_history_size)
+        if self.boredom_history_size is not None:
+            boredom_handler = agent.get_interaction_memory().get_boredom_handler()
+            if isinstance(boredom_handler, (model.boredomhandler.RepetitiveBoredomHandler, model.boredomhandler.WeightRepetitiveBoredomHandler)):
+                boredom_handler.set_history_size(self.boredom_history_size)
+
+    def share_interaction_memory(self, primitives, motivation, composites = None):
+        """
+        Let the constructive agents created by the mapper share a base 
+        interaction memory holding the primitive interactions, their valences
+        and, optionally, a set of pre-trained composite interactions. Each 
+        agent gets an overlay on top of the shared memory that only stores what
+        the agent learns itself.
+
+        This should be called before parsing the world, and is used instead of
+        calling add_primitives and add_motivations on every agent. Homeostatic
+        agents, whose valences depend on their own state, are not supported 
+        and keep their own interaction memory.
+
+        :param primitives: The primitive interactions known to the agents.
+        :param motivation: A dictionary mapping primitive interactions to their
+                           valences.
+        :param composites: Optional, a list of tuples of pre-trained composite
+                           interactions and their weights.
+        :return: The shared base interaction memory.
+        :rtype: model.interactionmemory.InteractionMemory
+        """
+        base = model.interactionmemory.InteractionMemory()
+        for primitive in primitives:
+            base.add_interaction(primitive)
+        for primitive, valence in motivation.iteritems():
+            base.set_valence(primitive, valence)
+        if composites is not None:
+            for composite, weight in composites:
+                base.add_interaction(composite, weight)
+
+        self.shared_interaction_memory = base
+        return base
+
+    def setup_agent_interaction_memory(self, agent):
+        """
+        Give a constructive agent an overlay on the shared interaction memory,
+        if the agents of this experiment share an interaction memory.
+
+        :param agent: The agent to set up.
+        :return: The agent.
+        """
+        if self.shared_interaction_memory is not None and not isinstance(agent, model.agent.HomeostaticConstructiveAgent):
+            agent.set_interaction_memory(model.interactionmemory.OverlayInteractionMemory(self.shared_interaction_memory))
+        return agent
+
     def get_world(self):
         """
         Get the world generated by this experiment.
@@ -133,6 +227,20 @@ class Experiment(object):
         a = dill.load(open(file_path, "rb"))
         return a
 
+    def load_agent_json(self, file_name, agent):
+        """
+        Load the interaction memory of an agent exported to JSON into the
+        interaction memory of an agent.
+
+        :param file_name: The name of the file to load the agent from (e.g., "20161118T035805 - Agent DZX26I.json").
+        :param agent: The agent to load the interaction memory into.
+        :return: The agent.
+        """
+        file_path = os.path.join(settings.AGENT_DIR, file_name)
+        with open(file_path, "r") as f:
+            agent.read_json(f)
+        return agent
+
     def load_world(self, file_name):
         """
         Load a world from file.
@@ -6,6 +6,7 @@ import sys
 import string
 import abc
 import random
+import json
 import pygame
 import entity
 import interaction
@@ -13,6 +14,8 @@ import interactionmemory
 import events
 from appstate import AppState
 import settings
+import utilities.orderedset
+import utilities.ringbuffer
 
 class Agent(entity.Entity):
     """
@@ -82,6 +85,9 @@ class Agent(entity.Entity):
         else:
             raise Exception("No perception handler has been set")
 
+    def get_perception_handler(self):
+        return self.perception_handler
+
     def set_perception_handler(self, perception_handler):
         self.perception_handler = perception_handler
 
@@ -111,6 +117,27 @@ class Agent(entity.Entity):
             'interaction_memory': self.interaction_memory
         }
 
+    def write_json(self, f):
+        """
+        Write the JSON encoding of this agent to a file, streaming the 
+        encoding of its interaction memory.
+
+        :param f: The file to write to.
+        """
+        f.write('{"name": %s,\n"interaction_memory": ' % json.dumps(self.name))
+        self.interaction_memory.write_json(f)
+        f.write('}\n')
+
+    def read_json(self, f):
+        """
+        Load the interaction memory of an agent written by write_json into
+        the interaction memory of this agent.
+
+        :param f: The file to read from.
+        """
+        data = json.load(f)
+        self.interaction_memory.load_json(data['interaction_memory'])
+
 class SimpleAgent(Agent):
     """
     An agent with a simple existence.
@@ -124,9 +151,8 @@ class SimpleAgent(Agent):
         :return: A list of possible (primitive) interactions.
         """
         interactions = []
-        for composite_interaction in self.interaction_memory.get_composite_interactions():
-            if composite_interaction.get_pre() == self.enacted:
-                interactions.append(composite_interaction.get_post())
+        for composite_interaction in self.interaction_memory.get_composite_interactions_with_pre(self.enacted):
+            interactions.append(composite_interaction.get_post())
 
         return interactions
 
@@ -158,7 +184,7 @@ class SimpleAgent(Agent):
         :param context: The context (pre-interaction).
         :param enacted: The newly enecated interaction (post-interaction).
         """
-        composite = interaction.CompositeInteraction(context, enacted)
+        composite = interaction.get_composite_interaction(context, enacted)
         if composite not in self.interaction_memory.get_composite_interactions():
             self.interaction_memory.add_interaction(composite)
         else:
@@ -197,14 +223,68 @@ class ConstructiveAgent(Agent):
     abstract and processes all experiments in the same way.
     """
 
+    #: The default number of enacted interactions kept in the history
+    HISTORY_SIZE = 100
+
     def __init__(self):
         super(ConstructiveAgent, self).__init__()
         self.enacting_interaction = False
         self.enacting_interaction_step = 0
         self.enacting_interaction_sequence = []
         self.enacted_sequence = []
-        self.context = []
-        self.history = []
+        self.intended_interaction = None
+        self.context = utilities.orderedset.OrderedSet()
+        self.history = utilities.ringbuffer.RingBuffer(self.HISTORY_SIZE)
+
+    def __setstate__(self, state):
+        super(ConstructiveAgent, self).__setstate__(state)
+        if isinstance(self.history, list):
+            # An agent pickled before interactions were interned, and before
+            # the context and history were an ordered set and a ring buffer
+            self.context = utilities.orderedset.OrderedSet(i.get_canonical() for i in self.context)
+            self.history = utilities.ringbuffer.RingBuffer(self.HISTORY_SIZE, [i.get_canonical() for i in self.history])
+            self.enacting_interaction_sequence = [i.get_canonical() for i in self.enacting_interaction_sequence]
+            self.enacted_sequence = [i.get_canonical() for i in self.enacted_sequence]
+            if getattr(self, "intended_interaction", None) is not None:
+                self.intended_interaction = self.intended_interaction.get_canonical()
+            else:
+                self.intended_interaction = None
+
+    def set_history_size(self, size):
+        """
+        Set the number of enacted interactions kept in the history. The most
+        recent interactions are kept.
+
+        :param size: The number of interactions to keep.
+        """
+        self.history = utilities.ringbuffer.RingBuffer(size, self.history[-size:])
+
+    def get_known_interaction(self, interaction_):
+        """
+        Get an interaction if it is known to the interaction memory, or else 
+        the most recent part of its hierarchy that is (i.e., the first known
+        interaction following post-interactions).
+
+        :param interaction_: The interaction.
+        :return: The interaction or the known part of its hierarchy.
+        """
+        composites = self.interaction_memory.get_composite_interactions()
+        while isinstance(interaction_, interaction.CompositeInteraction) and interaction_ not in composites:
+            interaction_ = interaction_.get_post()
+        return interaction_
+
+    def forget_evicted_interactions(self):
+        """
+        Drop the references of this agent to composite interactions that have
+        been evicted from the interaction memory. Evicted interactions in the
+        history are replaced by the known part of their hierarchy. (The 
+        context is rebuilt from known interactions in update_context.)
+        """
+        for index in range(len(self.history)):
+            self.history[index] = self.get_known_interaction(self.history[index])
+
+        if self.intended_interaction is not None and self.get_known_interaction(self.intended_interaction) is not self.intended_interaction:
+            self.intended_interaction = None
 
     def activate_interactions(self):
         """
@@ -214,9 +294,8 @@ class ConstructiveAgent(Agent):
         context are activated.
         """
         activated = []
-        for composite_interaction in self.interaction_memory.get_composite_interactions():
-            if composite_interaction.get_pre() in self.context:
-                activated.append(composite_interaction)
+        for pre_interaction in self.context:
+            activated.extend(self.interaction_memory.get_composite_interactions_with_pre(pre_interaction))
 
         return activated
 
@@ -247,7 +326,7 @@ class ConstructiveAgent(Agent):
 
         return proposed
 
-    def consider_alternative_interactions(self):
+    def score_proposed_interactions(self):
         """
         Add-on to the sequential system, between steps 2 and 3.
 
@@ -258,29 +337,62 @@ class ConstructiveAgent(Agent):
         anticipates that the alternative might happen instead of the intended
         interaction. The intended interaction's proclivity is temporarily
         adjusted to reflect this.
+
+        All proposals are scored in one batch: the activation weights are 
+        multiplied with the boredom-adjusted valences, and the proclivities of
+        proposed alternatives are added.
+
+        :return: A tuple of the list of proposed interactions and a sequence
+                 of their (adjusted) proclivities.
         """
-        proposed = self.propose_interactions()
+        proposed = list(self.propose_interactions())
+        interactions = [proposed_interaction for (proposed_interaction, weight) in proposed]
 
-        proposed = map(lambda (proposed_interaction, weight):
-            (
-                proposed_interaction,
-                weight * self.interaction_memory.get_valence(proposed_interaction, process_boredom = True)
-            ), proposed)
+        if len(interactions) == 0:
+            return ([], [])
 
-        n = 0
+        valences = self.interaction_memory.get_valences_of(interactions)
+        bored_valences = self.interaction_memory.process_boredom(interactions, valences)
 
-        proposed_interactions = map(lambda (proposed_interaction, proclivity): proposed_interaction, proposed)
+        # Find the (proposal, proposed alternative) pairs. The alternatives of
+        # a proposal are matched against the proposals by iterating over the
+        # smaller of the two.
+        indices = {proposed_interaction: n for n, proposed_interaction in enumerate(interactions)}
+        proposals = []
+        alternatives = []
+        for n, proposed_interaction in enumerate(interactions):
+            proposed_alternatives = self.interaction_memory.get_alternative_interactions(proposed_interaction)
+            if len(proposed_alternatives) == 0:
+                continue
 
-        for (proposed_interaction, proclivity) in proposed:
-            for alternative in self.interaction_memory.get_alternative_interactions(proposed_interaction):
-                if alternative in proposed_interactions:
-                    AppState.get_state().get_logger().info("%s - Anticipating alternative %s for %s" % (self.name, alternative, proposed_interaction))
-                    proclivity += self.interaction_memory.get_proclivity(alternative)
-            proposed[n] = (proposed_interaction, proclivity)
-            n += 1
+            if len(proposed_alternatives) <= len(indices):
+                matches = [indices[alternative] for alternative in proposed_alternatives if alternative in indices]
+            else:
+                matches = [m for m, alternative in enumerate(interactions) if alternative in proposed_alternatives]
 
-        return proposed
+            for m in matches:
+                AppState.get_state().get_logger().info("%s - Anticipating alternative %s for %s" % (self.name, interactions[m], proposed_interaction))
+                proposals.append(n)
+                alternatives.append(m)
+
+        proclivities = [weight * valence for ((proposed_interaction, weight), valence) in zip(proposed, bored_valences)]
+
+        for (n, m) in zip(proposals, alternatives):
+            proclivities[n] += self.interaction_memory.get_weight(interactions[m]) * valences[m]
+
+        return (interactions, proclivities)
+
+    def consider_alternative_interactions(self):
+        """
+        Add-on to the sequential system, between steps 2 and 3.
 
+        See score_proposed_interactions.
+
+        :return: A list of tuples of proposed interactions and their 
+                 (adjusted) proclivities.
+        """
+        (interactions, proclivities) = self.score_proposed_interactions()
+        return zip(interactions, proclivities)
 
     def select_intended_interaction(self):
         """
@@ -291,15 +403,17 @@ class ConstructiveAgent(Agent):
 
         The intended interaction is selected from the proposed interactions
         based on the weight of the activated interactions and the values of the
-        proposed post interactions.
+        proposed post interactions. Only the best proposal is needed, so it is
+        selected directly instead of sorting all proposals (ties are broken in
+        favour of the first proposal).
         """
 
-        proposed = self.consider_alternative_interactions()
-        proposed.sort(
-            key = lambda x: x[1],
-            reverse = True
-        )
-        proposed = map(lambda x: x[0], proposed)
+        (interactions, proclivities) = self.score_proposed_interactions()
+        if len(interactions) > 0:
+            best = max(range(len(proclivities)), key = lambda n: proclivities[n])
+            proposed = [interactions[best]]
+        else:
+            proposed = []
 
         """
         Without alternatives:
@@ -334,7 +448,7 @@ class ConstructiveAgent(Agent):
         :param learned_or_reinforced: A list of interactions that were just
                                       learned or reinforced.
         """
-        self.context = []
+        self.context = utilities.orderedset.OrderedSet()
 
         """
         According to paper: 
@@ -346,21 +460,22 @@ class ConstructiveAgent(Agent):
         """
         
         for interaction_ in learned_or_reinforced:
+            # Interactions evicted while learning have a weight of 0
             if self.interaction_memory.get_weight(interaction_) > 3:
-                self.context.append(interaction_)
+                self.context.add(interaction_)
 
         if isinstance(enacted_interaction, interaction.CompositeInteraction):
-            self.context.append(enacted_interaction.get_post())
+            self.context.add(enacted_interaction.get_post())
 
-        self.context.append(enacted_interaction)
+        self.context.add(enacted_interaction)
         
         """
         Alternative context method:
         """
         """
-        self.context.append(enacted_interaction)
+        self.context.add(enacted_interaction)
         for interaction in learned_or_reinforced:
-            self.context.append(interaction.get_pre())
+            self.context.add(interaction.get_pre())
         """
         
 
@@ -440,37 +555,39 @@ class ConstructiveAgent(Agent):
             if len(self.history) >= 1:
                 previous = self.history[-1]
                 # <interaction at t-1, enacted interaction>
-                t1enacted = interaction.CompositeInteraction(previous, enacted)
+                t1enacted = interaction.get_composite_interaction(previous, enacted)
                 learned_or_reinforced.append(t1enacted)
 
                 if len(self.history) >= 2:
                     penultimate = self.history[-2]
                     # <interaction at t-2, interaction at t-1>
-                    t2t1 = interaction.CompositeInteraction(penultimate, previous)
+                    t2t1 = interaction.get_composite_interaction(penultimate, previous)
 
                     # <<interaction at t-2, interaction at t-1>, enacted interaction>
-                    t2t1_enacted = interaction.CompositeInteraction(t2t1, enacted)
+                    t2t1_enacted = interaction.get_composite_interaction(t2t1, enacted)
                     learned_or_reinforced.append(t2t1_enacted)
 
                     # <interaction at t-2, <interaction at t-1, enacted interaction>>
-                    t2_t1enacted = interaction.CompositeInteraction(penultimate, t1enacted)
+                    t2_t1enacted = interaction.get_composite_interaction(penultimate, t1enacted)
                     learned_or_reinforced.append(t2_t1enacted)
+            eviction_count = self.interaction_memory.get_eviction_count()
             for composite in learned_or_reinforced:
-                if composite not in self.interaction_memory.get_composite_interactions():
-                    self.interaction_memory.add_interaction(composite)
-                else:
-                    self.interaction_memory.increment_weight(composite)
+                self.interaction_memory.reinforce_interaction(composite)
+
+            if self.interaction_memory.get_eviction_count() != eviction_count:
+                # Composite interactions were evicted while learning, possibly
+                # including the enacted interaction
+                self.forget_evicted_interactions()
+                enacted = self.get_known_interaction(enacted)
                     
-            # Keep history of last 100 actions performed
-            if len(self.history) > 100:
-                self.history.pop(0)
+            # Keep history of last actions performed
             self.history.append(enacted)
 
             """
             According to the paper:
 
             for pre_interaction in self.context:
-                composite = interaction.CompositeInteraction(pre_interaction, enacted)
+                composite = interaction.get_composite_interaction(pre_interaction, enacted)
                 learned_or_reinforced.append(composite)
                 if composite not in self.interaction_memory.get_composite_interactions():
                     self.interaction_memory.add_interaction(composite)
@@ -493,15 +610,31 @@ class HomeostaticConstructiveAgent(ConstructiveAgent):
     def __init__(self):
         super(HomeostaticConstructiveAgent, self).__init__()
         self.homeostasis = {}
+        self.homeostasis_version = 0
+
+    def __setstate__(self, state):
+        state.setdefault("homeostasis_version", 0)
+        super(HomeostaticConstructiveAgent, self).__setstate__(state)
 
     def set_homeostatic_value(self, homeostatic_property, value):
         self.homeostasis[homeostatic_property] = value
+        self.homeostasis_version += 1
 
     def get_homeostatic_value(self, homeostatic_property):
         return self.homeostasis[homeostatic_property]
 
     def add_to_homeostatic_value(self, homeostatic_property, delta_value):
         self.homeostasis[homeostatic_property] += delta_value
+        self.homeostasis_version += 1
+
+    def get_homeostasis_version(self):
+        """
+        Get the version of the homeostatic state. The version changes whenever
+        a homeostatic value is set or changed.
+
+        :return: The homeostatic state version.
+        """
+        return self.homeostasis_version
 
     def setup_interaction_memory(self):
         self.interaction_memory = interactionmemory.HomeostaticInteractionMemory(self)
@@ -24,6 +24,23 @@ class BoredomHandler(object):
         """
         raise NotImplementedError("Should be implemented by child")
 
+    def process_boredom_batch(self, interaction_memory, interactions, unmodified_valences):
+        """
+        Modifies the valences of multiple interactions such that boredom is
+        handled. Handlers can override this to share work between the 
+        interactions that are evaluated in the same decision.
+
+        :param interaction_memory: The interaction memory
+        :param interactions: The interactions to process boredom for
+        :param unmodified_valences: The unmodified (raw) valences of the 
+                                    interactions
+        :return: A list of modified valences taking boredom into account
+        """
+        return [
+            self.process_boredom(interaction_memory, interaction, unmodified_valence)
+            for interaction, unmodified_valence in zip(interactions, unmodified_valences)
+        ]
+
 
 class PassthroughBoredomHandler(BoredomHandler):
     """
@@ -32,6 +49,9 @@ class PassthroughBoredomHandler(BoredomHandler):
     def process_boredom(self, interaction_memory, interaction, unmodified_valence):
         return unmodified_valence
 
+    def process_boredom_batch(self, interaction_memory, interactions, unmodified_valences):
+        return list(unmodified_valences)
+
 class WeightBoredomHandler(BoredomHandler):
     """
     A boredom handler taking into account the weight of interactions. The sum
@@ -47,18 +67,13 @@ class WeightBoredomHandler(BoredomHandler):
         interaction. E.g., for a composite interaction <i1, i2> the sum is
         weight(<i1, i2>) = <i1, i2>.weight + weight(i1) + weight(i2).
 
+        The interaction memory maintains these weights incrementally.
+
         :param interaction_memory: The interaction memory
         :param interaction: The interaction to get the hierarchical weight for
         :return: The hierarchical weight of the interaction
         """
-        if isinstance(interaction, model.interaction.CompositeInteraction):
-            return (
-                interaction_memory.get_weight(interaction) 
-                + self.interaction_total_weight(interaction_memory, interaction.get_pre()) 
-                + self.interaction_total_weight(interaction_memory, interaction.get_post())
-            )
-        else:
-            return interaction_memory.get_weight(interaction)
+        return interaction_memory.get_hierarchical_weight(interaction)
     
     def process_boredom(self, interaction_memory, interaction, unmodified_valence):
         if unmodified_valence > 0:
@@ -69,6 +84,18 @@ class WeightBoredomHandler(BoredomHandler):
         else:
             return unmodified_valence
 
+    def process_boredom_batch(self, interaction_memory, interactions, unmodified_valences):
+        sum = float(interaction_memory.get_total_weight())
+        valences = []
+        for interaction, unmodified_valence in zip(interactions, unmodified_valences):
+            if unmodified_valence > 0:
+                weight = self.interaction_total_weight(interaction_memory, interaction)
+                modifier = (1 - float(weight)/sum)
+                valences.append(unmodified_valence * modifier)
+            else:
+                valences.append(unmodified_valence)
+        return valences
+
 class RepetitiveBoredomHandler(BoredomHandler):
     """
     A boredom handler taking into the account the last few (primitive)
@@ -76,8 +103,29 @@ class RepetitiveBoredomHandler(BoredomHandler):
     with the proposed interaction. The more similar, the more the interaction
     is penalized.
     """
-    
-    HISTORY_CONSIDER_SIZE = 15
+
+    def __init__(self, history_size = 15):
+        """
+        :param history_size: The number of most recent (primitive) 
+                             interactions to compare with.
+        """
+        self.history_size = history_size
+
+    def get_history_size(self):
+        """
+        Get the number of most recent (primitive) interactions compared with.
+
+        :return: The history size.
+        """
+        return self.history_size
+
+    def set_history_size(self, history_size):
+        """
+        Set the number of most recent (primitive) interactions to compare with.
+
+        :param history_size: The history size.
+        """
+        self.history_size = history_size
 
     def count_interactions(self, interaction_sequence):
         """
@@ -105,31 +153,50 @@ class RepetitiveBoredomHandler(BoredomHandler):
         :return: The cosine similarity between the two counts
         """
 
-        c1_dot_c2 = 0
         c1_len_squared = 0
-        c2_len_squared = 0
-
         for interaction_name in count1:
-            c1_dot_c2 += count1[interaction_name] * count2[interaction_name]
             c1_len_squared += count1[interaction_name]**2
 
-        for interaction_name in count2:
-            c2_len_squared += count2[interaction_name]**2
+        return self.similarity_with_length(count1, c1_len_squared, count2)
 
+    def similarity_with_length(self, count1, c1_len_squared, count2):
+        """
+        Calculate the cosine similarity between two counts, where the squared
+        length of the first count is already known.
+
+        :param count1: The first interaction count
+        :param c1_len_squared: The squared length of the first count
+        :param count2: The second interaction count
+        :return: The cosine similarity between the two counts
+        """
         if c1_len_squared == 0:
             return -1
-        else:
-            return c1_dot_c2 / (math.sqrt(c1_len_squared) * math.sqrt(c2_len_squared))
+
+        c1_dot_c2 = 0
+        c2_len_squared = 0
+
+        for interaction_name in count2:
+            c1_dot_c2 += count1[interaction_name] * count2[interaction_name]
+            c2_len_squared += count2[interaction_name]**2
+
+        return c1_dot_c2 / (math.sqrt(c1_len_squared) * math.sqrt(c2_len_squared))
 
     def process_boredom(self, interaction_memory, interaction, unmodified_valence):
-        history = interaction_memory.get_interaction_history()[-self.HISTORY_CONSIDER_SIZE:]
-        history_count = self.count_interactions(history)
-        interaction_count = self.count_interactions(interaction.unwrap())
+        return self.process_boredom_batch(interaction_memory, [interaction], [unmodified_valence])[0]
 
-        similarity = self.similarity(history_count, interaction_count)
-        modifier = 1 - similarity
+    def process_boredom_batch(self, interaction_memory, interactions, unmodified_valences):
+        # The history vector and its length are maintained by the memory
+        (history_count, history_len_squared) = interaction_memory.get_interaction_history_count(self.history_size)
 
-        return unmodified_valence * modifier
+        valences = []
+        for interaction, unmodified_valence in zip(interactions, unmodified_valences):
+            interaction_count = self.count_interactions(interaction.unwrap())
+
+            similarity = self.similarity_with_length(history_count, history_len_squared, interaction_count)
+            modifier = 1 - similarity
+
+            valences.append(unmodified_valence * modifier)
+        return valences
 
 class WeightRepetitiveBoredomHandler(BoredomHandler):
     """
@@ -137,9 +204,32 @@ class WeightRepetitiveBoredomHandler(BoredomHandler):
     boredom handler by taking the average valence output of the two.
     """
 
-    def __init__(self):
+    def __init__(self, history_size = 15):
+        """
+        :param history_size: The number of most recent (primitive) 
+                             interactions the repetitive boredom handler
+                             compares with.
+        """
         self.weightBoredomHandler = WeightBoredomHandler()
-        self.repetitiveBoredomHandler = RepetitiveBoredomHandler()
+        self.repetitiveBoredomHandler = RepetitiveBoredomHandler(history_size)
+
+    def get_history_size(self):
+        """
+        Get the number of most recent (primitive) interactions the repetitive
+        boredom handler compares with.
+
+        :return: The history size.
+        """
+        return self.repetitiveBoredomHandler.get_history_size()
+
+    def set_history_size(self, history_size):
+        """
+        Set the number of most recent (primitive) interactions the repetitive
+        boredom handler compares with.
+
+        :param history_size: The history size.
+        """
+        self.repetitiveBoredomHandler.set_history_size(history_size)
 
     def process_boredom(self, interaction_memory, interaction, unmodified_valence):
         return (
@@ -147,3 +237,11 @@ class WeightRepetitiveBoredomHandler(BoredomHandler):
             +
             self.repetitiveBoredomHandler.process_boredom(interaction_memory, interaction, unmodified_valence)
             ) / 2
+
+    def process_boredom_batch(self, interaction_memory, interactions, unmodified_valences):
+        weight_valences = self.weightBoredomHandler.process_boredom_batch(interaction_memory, interactions, unmodified_valences)
+        repetitive_valences = self.repetitiveBoredomHandler.process_boredom_batch(interaction_memory, interactions, unmodified_valences)
+        return [
+            (weight_valence + repetitive_valence) / 2
+            for weight_valence, repetitive_valence in zip(weight_valences, repetitive_valences)
+        ]
@@ -11,12 +11,18 @@ class Entity(object):
     Class that represents an entity that can be placed in a world.
 
     The position of the entity is its top-left corner.
+
+    Once added to a world, the entity notifies the world of changes to its 
+    position and size, such that the world's spatial index stays up to date.
+    The position should therefore only be changed through the methods of the
+    entity.
     """
 
     width = 1
     height = 1
     step_size = 1
     rect = None
+    world = None
 
     def __init__(self, position = None, rotation = 0):
         if position is None:
@@ -28,6 +34,34 @@ class Entity(object):
     def get_position(self):
         return self.position
 
+    def get_world(self):
+        """
+        Get the world this entity is in.
+
+        :return: The world, or None if the entity has not been added to a world.
+        """
+        return self.world
+
+    def set_world(self, world):
+        """
+        Set the world this entity is in. Called by the world when the entity is
+        added to or removed from it.
+
+        :param world: The world, or None.
+        """
+        self.world = world
+
+    def __getstate__(self):
+        # The world is not pickled with the entity; a pickled world sets it
+        # again when it is loaded
+        state = self.__dict__.copy()
+        state.pop("world", None)
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("world", None)
+        self.__dict__.update(state)
+
     def get_spanning_positions(self):
         """
         As an entity can be larger than 1x1, it might span multiple cells.
@@ -53,13 +87,21 @@ class Entity(object):
         return (self.position.get_x(), self.position.get_y(), width, height)
 
     def set_position(self, position):
+        if self.world is not None:
+            self.world.unindex_entity(self)
         self.position.set(position)
+        if self.world is not None:
+            self.world.index_entity(self)
 
     def set_rotation(self, rotation):
         self.rotation = rotation % 360
 
     def add_position(self, positionDelta):
+        if self.world is not None:
+            self.world.unindex_entity(self)
         self.position.add(positionDelta)
+        if self.world is not None:
+            self.world.index_entity(self)
 
     def add_rotation(self, rotationDelta):
         self.rotation += rotationDelta
@@ -98,7 +140,7 @@ class Entity(object):
 
         :param steps: The number of steps to move the agent.
         """
-        self.position.add(self.get_move_delta(steps))
+        self.add_position(self.get_move_delta(steps))
 
     def get_move_delta(self, steps = 1):
         """
@@ -180,13 +222,21 @@ class Entity(object):
         return self.width
 
     def set_width(self, width):
+        if self.world is not None:
+            self.world.unindex_entity(self)
         self.width = width
+        if self.world is not None:
+            self.world.index_entity(self)
 
     def get_height(self):
         return self.height
 
     def set_height(self, height):
+        if self.world is not None:
+            self.world.unindex_entity(self)
         self.height = height
+        if self.world is not None:
+            self.world.index_entity(self)
 
     @abc.abstractmethod
     def collidable(self):
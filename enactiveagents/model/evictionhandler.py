@@ -0,0 +1,71 @@
+"""
+Module that holds classes that represent an interaction memory's eviction
+handler. When an interaction memory with a bounded capacity is full, the
+eviction handler chooses which composite interactions are forgotten.
+"""
+
+import abc
+import heapq
+
+class EvictionHandler(object):
+    """
+    Abstract eviction handler class.
+    """
+
+    @abc.abstractmethod
+    def select_evictions(self, interaction_memory, candidates, count):
+        """
+        Select the composite interactions that are to be evicted from the
+        interaction memory.
+
+        :param interaction_memory: The interaction memory
+        :param candidates: An iterable of composite interactions that may be
+                           evicted
+        :param count: The number of interactions to evict
+        :return: A list of at most count interactions to evict
+        """
+        raise NotImplementedError("Should be implemented by child")
+
+class LowestWeightEvictionHandler(EvictionHandler):
+    """
+    An eviction handler forgetting the interactions with the lowest weight.
+    Ties are broken in favour of forgetting the oldest interactions.
+    """
+
+    def select_evictions(self, interaction_memory, candidates, count):
+        return heapq.nsmallest(count, candidates, key = interaction_memory.get_weight)
+
+class LeastRecentlyReinforcedEvictionHandler(EvictionHandler):
+    """
+    An eviction handler forgetting the interactions that have not been learned
+    or reinforced for the longest time.
+    """
+
+    def select_evictions(self, interaction_memory, candidates, count):
+        return heapq.nsmallest(count, candidates, key = interaction_memory.get_last_reinforced)
+
+class DecayedWeightEvictionHandler(EvictionHandler):
+    """
+    An eviction handler forgetting the interactions with the lowest decayed
+    weight. The weight of an interaction decays exponentially with the number
+    of reinforcements (of any interaction) since it was last reinforced, such
+    that heavy but stale interactions are eventually forgotten as well.
+    """
+
+    def __init__(self, decay = 0.99):
+        """
+        :param decay: The factor the weight is multiplied with per
+                      reinforcement since the interaction was last reinforced.
+        """
+        self.decay = decay
+
+    def select_evictions(self, interaction_memory, candidates, count):
+        time = interaction_memory.get_reinforcement_time()
+        return heapq.nsmallest(
+            count,
+            candidates,
+            key = lambda interaction: (
+                interaction_memory.get_weight(interaction)
+                * self.decay ** (time - interaction_memory.get_last_reinforced(interaction))
+            )
+        )
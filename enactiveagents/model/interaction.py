@@ -1,8 +1,25 @@
 """
 Module to hold interaction classes.
+
+Interactions are immutable and interned: there is one canonical instance per
+distinct interaction in the process, which is shared by all agents. The 
+constructors return the canonical instance if it exists already; the 
+get_primitive_interaction, get_primitive_perception_interaction and 
+get_composite_interaction factories do the same, and are preferred.
+
+Every interaction carries a structural id, assigned when its canonical 
+instance is created. As interactions are interned, the structural id is the
+same for all interactions with the same structure in the process, and 
+interactions are compared by it.
+Structural ids are not pickled; they are assigned again when interactions are
+loaded. Interactions pickled before interactions were interned are loaded as
+copies of the canonical instance, which are equal to it.
 """
 
 import abc
+import itertools
+import weakref
+import percept
 
 class Interaction(object):
     def __init__(self, name):
@@ -23,10 +40,20 @@ class Interaction(object):
         Get the sequence of interactions represented by this interaction.
         
         :return: The sequence of interactions represented by this itneraction.
+        :rtype: tuple
         """
         raise NotImplementedError("Should be implemented by child")
 
-    @abc.abstractmethod
+    def get_length(self):
+        """
+        Get the number of primitive interactions represented by this
+        interaction.
+
+        :return: The length of the sequence of interactions represented by 
+                 this interaction.
+        """
+        return 1
+
     def reconstruct_from_hierarchy(self, sequence):
         """
         Reconstruct a sequence of enacted (primitive) interactions into the
@@ -36,18 +63,112 @@ class Interaction(object):
         An intrinsically-motivated schema mechanism to model and simulate 
         emergent cognition. Cognitive Systems Research, 15, 73-92.
 
+        The hierarchy is walked iteratively while a cursor moves through the
+        sequence, which is not modified. If the sequence runs out after the
+        pre-interaction of a composite interaction, the reconstruction of the
+        pre-interaction takes the place of the composite. Parts of the 
+        hierarchy that were enacted as intended are returned as is, and other
+        composite interactions are obtained from get_composite_interaction, so
+        the result is always a canonical instance.
+
         :param sequence: The sequence of primitive interactions to turn into a
                          composite/primitive interaction.
         :return: The composite/primitive interaction reconstructed from the 
                  sequence.
         """
+        length = len(sequence)
+        cursor = 0
+        composites = []
+        pres = []
+        node = self
+
+        while True:
+            # Descend to the first primitive of the current node
+            while isinstance(node, CompositeInteraction):
+                composites.append(node)
+                pres.append(None)
+                node = node.pre
+
+            result = sequence[cursor]
+            cursor += 1
+
+            # Ascend until a composite interaction's post-interaction remains
+            # to be reconstructed
+            while len(composites) > 0:
+                if pres[-1] is None:
+                    if cursor < length:
+                        pres[-1] = result
+                        node = composites[-1].post
+                        break
+                    else:
+                        composites.pop()
+                        pres.pop()
+                else:
+                    composite = composites.pop()
+                    pre = pres.pop()
+                    if pre is composite.pre and result is composite.post:
+                        result = composite
+                    else:
+                        result = get_composite_interaction(pre, result)
+            else:
+                return result
+
+    @abc.abstractmethod
+    def get_canonical(self):
+        """
+        Get the canonical instance of this interaction.
+
+        :return: The canonical instance.
+        :rtype: Interaction
+        """
         raise NotImplementedError("Should be implemented by child")
 
+    def __setstate__(self, state):
+        # Only interactions pickled before interactions were interned are
+        # loaded from their state. They become a copy of the canonical 
+        # instance, which they keep alive so that the structural id stays 
+        # valid.
+        self.__dict__.update(state)
+        canonical = self.get_canonical()
+        self.__dict__.update(canonical.__dict__)
+        self.canonical = canonical
+
+    def get_structural_id(self):
+        """
+        Get the structural id of this interaction. Interactions have the same
+        structural id if and only if they are equal.
+
+        :return: The structural id.
+        :rtype: int
+        """
+        return self.structural_id
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        elif isinstance(other, Interaction):
+            return self.structural_id == other.structural_id
+        else:
+            return False
+
     def __ne__(self, other):
         return not self == other
 
 
 class PrimitiveInteraction(Interaction):
+    def __new__(cls, name = None, result = None):
+        if name is None:
+            # Loading an interaction pickled before interactions were interned
+            return super(PrimitiveInteraction, cls).__new__(cls)
+
+        key = (name, result)
+        primitive = _primitive_interactions.get(key)
+        if primitive is None:
+            primitive = super(PrimitiveInteraction, cls).__new__(cls)
+            primitive.structural_id = next(_structural_id_counter)
+            _primitive_interactions[key] = primitive
+        return primitive
+
     def __init__(self, name, result):
         super(PrimitiveInteraction, self).__init__(name)
         self.result = result
@@ -61,25 +182,22 @@ class PrimitiveInteraction(Interaction):
         """
         return self.result
 
+    def get_canonical(self):
+        return get_primitive_interaction(self.name, self.result)
+
     def unwrap(self):
         """
         Get the primitive interaction as a singleton.
         
         :return: The primitive interaction as a singleton.
         """
-        return [self]
-
-    def reconstruct_from_hierarchy(self, sequence):
-        return sequence.pop(0)
+        return (self,)
 
     def to_json(self):
         return {"name": self.name, "result": self.result}
 
-    def __eq__(self, other):
-        if isinstance(other, PrimitiveInteraction):
-            return self.name == other.name and self.result == other.result
-        else:
-            return False
+    def __reduce__(self):
+        return (get_primitive_interaction, (self.name, self.result))
 
     def __hash__(self):
         return self.hash
@@ -95,6 +213,19 @@ class PrimitivePerceptionInteraction(Interaction):
     A primitive perception interaction is a construct containing both a
     primitive interaction and a perception.
     """
+    def __new__(cls, interaction = None, perception = None):
+        if interaction is None:
+            # Loading an interaction pickled before interactions were interned
+            return super(PrimitivePerceptionInteraction, cls).__new__(cls)
+
+        key = (interaction, perception)
+        perception_interaction = _primitive_perception_interactions.get(key)
+        if perception_interaction is None:
+            perception_interaction = super(PrimitivePerceptionInteraction, cls).__new__(cls)
+            perception_interaction.structural_id = next(_structural_id_counter)
+            _primitive_perception_interactions[key] = perception_interaction
+        return perception_interaction
+
     def __init__(self, interaction, perception):
         """
         :param interaction: An interaction
@@ -105,6 +236,15 @@ class PrimitivePerceptionInteraction(Interaction):
         self.perception = perception
         self.hash = hash((hash(self.interaction), hash(self.perception)))
 
+    def get_canonical(self):
+        return get_primitive_perception_interaction(self.interaction.get_canonical(), self.perception)
+
+    def __setstate__(self, state):
+        # Perceptions used to be strings, and are now percepts
+        if isinstance(state["perception"], basestring):
+            state["perception"] = percept.get_percept(state["perception"])
+        super(PrimitivePerceptionInteraction, self).__setstate__(state)
+
     def unwrap(self):
         """
         Get the primitive interaction and perception in the perception 
@@ -113,25 +253,22 @@ class PrimitivePerceptionInteraction(Interaction):
         :return: The primitive interaction and perception in the perception 
                  interaction as a singleton.
         """
-        return [self]
+        return (self,)
 
     def get_primitive_interaction(self):
         return self.interaction
 
+    def get_perception(self):
+        return self.perception
+
     def get_name(self):
         return str(self.interaction) + ":" + str(self.perception)
 
-    def reconstruct_from_hierarchy(self, sequence):
-        return sequence.pop(0)
-
     def to_json(self):
         return {"interaction": self.interaction, "perception": self.perception}
 
-    def __eq__(self, other):
-        if isinstance(other, PrimitivePerceptionInteraction):
-            return self.interaction == other.interaction and self.perception == other.perception
-        else:
-            return False
+    def __reduce__(self):
+        return (get_primitive_perception_interaction, (self.interaction, self.perception))
 
     def __repr__(self):
         return "PrimitivePerceptionInteraction(interaction=%r, perception=%r)" % (self.interaction, self.perception)
@@ -143,6 +280,19 @@ class PrimitivePerceptionInteraction(Interaction):
         return self.hash
 
 class CompositeInteraction(Interaction):
+    def __new__(cls, pre = None, post = None):
+        if pre is None:
+            # Loading an interaction pickled before interactions were interned
+            return super(CompositeInteraction, cls).__new__(cls)
+
+        key = (pre, post)
+        composite = _composite_interactions.get(key)
+        if composite is None:
+            composite = super(CompositeInteraction, cls).__new__(cls)
+            composite.structural_id = next(_structural_id_counter)
+            _composite_interactions[key] = composite
+        return composite
+
     def __init__(self, pre, post):
         """
         :param pre: The pre interaction
@@ -153,8 +303,16 @@ class CompositeInteraction(Interaction):
         self.pre = pre
         self.post = post
 
+        # Composites are immutable, so the primitive sequence they represent
+        # is flattened once and shared by all callers of unwrap.
+        self.primitives = self.pre.unwrap() + self.post.unwrap()
+        self.length = len(self.primitives)
+
         self.hash = hash((hash(self.pre), hash(self.post)))
 
+    def get_canonical(self):
+        return get_composite_interaction(self.pre.get_canonical(), self.post.get_canonical())
+
     def get_pre(self):
         return self.pre
 
@@ -165,29 +323,18 @@ class CompositeInteraction(Interaction):
         """
         Unwrap the composite interaction.
         
-        :return: A list of primitive interactions.
+        :return: A tuple of primitive interactions.
         """
-        return self.pre.unwrap() + self.post.unwrap()
+        return self.primitives
 
-    def reconstruct_from_hierarchy(self, sequence):
-        pre = self.pre.reconstruct_from_hierarchy(sequence)
-        if len(sequence) > 0:
-            post = self.post.reconstruct_from_hierarchy(sequence)
-            return CompositeInteraction(pre, post)
-        else:
-            return pre
+    def get_length(self):
+        return self.length
 
     def to_json(self):
         return {"pre": self.pre, "post": self.post}
 
-    def __eq__(self, other):
-        if isinstance(other, CompositeInteraction):
-            return self.pre == other.pre and self.post == other.post
-        else:
-            return False
-
-    def __ne__(self, other):
-        return not (self == other)
+    def __reduce__(self):
+        return (get_composite_interaction, (self.pre, self.post))
 
     def __repr__(self):
         return "CompositeInteraction(pre=%r,post=%r)" % (self.pre, self.post)
@@ -197,3 +344,56 @@ class CompositeInteraction(Interaction):
 
     def __hash__(self):
         return self.hash
+
+
+_structural_id_counter = itertools.count()
+
+_primitive_interactions = weakref.WeakValueDictionary()
+_primitive_perception_interactions = weakref.WeakValueDictionary()
+_composite_interactions = weakref.WeakValueDictionary()
+
+def get_primitive_interaction(name, result):
+    """
+    Get the canonical primitive interaction with the given name and result.
+    The interaction is created if it does not exist yet.
+
+    :param name: The name of the interaction.
+    :param result: The result of the interaction.
+    :return: The canonical primitive interaction.
+    :rtype: PrimitiveInteraction
+    """
+    primitive = _primitive_interactions.get((name, result))
+    if primitive is None:
+        primitive = PrimitiveInteraction(name, result)
+    return primitive
+
+def get_primitive_perception_interaction(interaction, perception):
+    """
+    Get the canonical primitive perception interaction with the given 
+    interaction and perception. The interaction is created if it does not 
+    exist yet.
+
+    :param interaction: The primitive interaction
+    :param perception: The (hashable) perception
+    :return: The canonical primitive perception interaction.
+    :rtype: PrimitivePerceptionInteraction
+    """
+    perception_interaction = _primitive_perception_interactions.get((interaction, perception))
+    if perception_interaction is None:
+        perception_interaction = PrimitivePerceptionInteraction(interaction, perception)
+    return perception_interaction
+
+def get_composite_interaction(pre, post):
+    """
+    Get the canonical composite interaction with the given pre- and 
+    post-interaction. The interaction is created if it does not exist yet.
+
+    :param pre: The pre interaction
+    :param post: The post interaction
+    :return: The canonical composite interaction.
+    :rtype: CompositeInteraction
+    """
+    composite = _composite_interactions.get((pre, post))
+    if composite is None:
+        composite = CompositeInteraction(pre, post)
+    return composite
@@ -2,25 +2,146 @@
 Module that holds classes that represent an agent's memory of interactions.
 """
 
+import array
+import collections
+import json
+import numbers
 import interaction
+import percept
 import model.boredomhandler
+import model.evictionhandler
+import utilities.orderedset
+import utilities.ringbuffer
+import utilities.customjsonencoder
+from appstate import AppState
 
 class InteractionMemory(object):
     """
     Class to represent the interaction memory of an agent.
+
+    Every interaction registered to the memory is assigned a dense integer id.
+    Weights, valences and reinforcement times are stored in arrays indexed by
+    these ids. Ids of forgotten interactions are reused.
     """
 
     INTERACTION_ENACTION_HISTORY_SIZE = 50
+    #: Fraction of the capacity evicted at once when the memory is full, so
+    #: that the cost of selecting interactions to evict is amortized.
+    EVICTION_BATCH_FRACTION = 0.1
 
-    def __init__(self, boredom_handler = model.boredomhandler.RepetitiveBoredomHandler):
+    def __init__(self, boredom_handler = model.boredomhandler.RepetitiveBoredomHandler, capacity = None, eviction_handler = model.evictionhandler.LowestWeightEvictionHandler):
+        """
+        :param boredom_handler: The boredom handler to use, or the boredom 
+                                handler class to instantiate.
+        :param capacity: Optional, the maximum number of composite interactions
+                         to remember. If None, the memory is unbounded.
+        :param eviction_handler: The eviction handler class choosing which
+                                 composite interactions to forget when the
+                                 capacity is exceeded.
+        """
         self.primitive_interactions = []
-        self.composite_interactions = []
-        self.valences = {}
-        self.weights = {}
+        self.composite_interactions = utilities.orderedset.OrderedSet()
+        self.composite_interactions_by_pre = {}
+        self.interaction_ids = {}
+        self.interactions_by_id = []
+        self.free_ids = []
+        self.weight_table = array.array('d')
+        self.valence_table = array.array('d')
+        self.reinforcement_table = array.array('l')
         self.alternative_interactions = {}
         self.weight_sum = 0
-        self.boredom_handler = boredom_handler()
-        self.interaction_enaction_history = []
+        if isinstance(boredom_handler, type):
+            boredom_handler = boredom_handler()
+        self.boredom_handler = boredom_handler
+        self.interaction_enaction_history = utilities.ringbuffer.RingBuffer(self.INTERACTION_ENACTION_HISTORY_SIZE)
+        self.history_counts = {}
+        self.history_count_lengths = {}
+        self.history_counts_requested = set()
+        self.valence_cache = {}
+        self.valence_cache_dependents = {}
+        self.valence_cache_hits = 0
+        self.valence_cache_misses = 0
+        self.capacity = capacity
+        self.eviction_handler = eviction_handler()
+        self.eviction_count = 0
+        self.reinforcement_time = 0
+        self.hierarchical_weights = {}
+        self.parent_interactions = {}
+
+    def register_interaction(self, interaction_):
+        """
+        Get the id of an interaction, assigning it a new id (with zero weight
+        and valence) if it has not been registered yet.
+
+        :param interaction_: The interaction to register.
+        :return: The id of the interaction.
+        """
+        if interaction_ in self.interaction_ids:
+            return self.interaction_ids[interaction_]
+
+        if len(self.free_ids) > 0:
+            id_ = self.free_ids.pop()
+            self.interactions_by_id[id_] = interaction_
+            self.weight_table[id_] = 0
+            self.valence_table[id_] = 0
+            self.reinforcement_table[id_] = 0
+        else:
+            id_ = len(self.interactions_by_id)
+            self.interactions_by_id.append(interaction_)
+            self.weight_table.append(0)
+            self.valence_table.append(0)
+            self.reinforcement_table.append(0)
+
+        self.interaction_ids[interaction_] = id_
+        return id_
+
+    def unregister_interaction(self, interaction_):
+        """
+        Release the id of an interaction so that it can be reused.
+
+        :param interaction_: The interaction to unregister.
+        """
+        id_ = self.interaction_ids.pop(interaction_)
+        self.interactions_by_id[id_] = None
+        self.weight_table[id_] = 0
+        self.free_ids.append(id_)
+
+    def get_interaction_id(self, interaction_):
+        """
+        Get the id of an interaction.
+
+        :param interaction_: The interaction.
+        :return: The id of the interaction, or None if it is not registered.
+        """
+        return self.interaction_ids.get(interaction_)
+
+    def get_interaction_by_id(self, id_):
+        """
+        Get the interaction registered with an id.
+
+        :param id_: The id.
+        :return: The interaction, or None if the id is not in use.
+        """
+        return self.interactions_by_id[id_]
+
+    def get_weight_table(self):
+        """
+        Get the weight table, an array of weights indexed by interaction id.
+
+        :return: The weight table.
+        :rtype: array.array
+        """
+        return self.weight_table
+
+    def get_valence_table(self):
+        """
+        Get the valence table, an array of primitive valences indexed by 
+        interaction id.
+
+        :return: The valence table.
+        :rtype: array.array
+        """
+        return self.valence_table
 
     def add_interaction(self, interaction_, weight=1, valence=0):
         """
@@ -33,14 +154,234 @@ class InteractionMemory(object):
         """
         if isinstance(interaction_, interaction.PrimitiveInteraction) or isinstance(interaction_, interaction.PrimitivePerceptionInteraction):
             self.primitive_interactions.append(interaction_)
-            self.valences[interaction_] = valence
+            id_ = self.register_interaction(interaction_)
+            if self.valence_table[id_] != valence:
+                self.invalidate_valence_cache(interaction_)
+            self.valence_table[id_] = valence
         elif isinstance(interaction_, interaction.CompositeInteraction):
-            self.composite_interactions.append(interaction_)
+            if interaction_ not in self.get_composite_interactions():
+                self.composite_interactions.add(interaction_)
+
+                # Index the composite by its pre-interaction
+                pre = interaction_.get_pre()
+                if pre not in self.composite_interactions_by_pre:
+                    self.composite_interactions_by_pre[pre] = []
+                self.composite_interactions_by_pre[pre].append(interaction_)
         else:
             raise TypeError("Expected interaction_ to be either primitive, primitive perception, or composite.")
 
-        self.weights[interaction_] = weight
+        id_ = self.register_interaction(interaction_)
+        delta = weight - self.weight_table[id_]
+        self.weight_table[id_] = weight
         self.weight_sum += weight
+        self.mark_reinforced(interaction_)
+
+        self.propagate_weight_change(interaction_, delta)
+        if isinstance(interaction_, interaction.CompositeInteraction):
+            self.track_hierarchy(interaction_)
+
+        if self.capacity is not None and len(self.composite_interactions) > self.capacity:
+            self.evict_interactions(interaction_)
+
+    def mark_reinforced(self, interaction_):
+        """
+        Record that an interaction has just been learned or reinforced.
+
+        :param interaction_: The interaction that was learned or reinforced.
+        """
+        self.reinforcement_time += 1
+        self.reinforcement_table[self.interaction_ids[interaction_]] = self.reinforcement_time
+
+    def get_reinforcement_time(self):
+        """
+        Get the reinforcement clock of this memory. The clock advances every
+        time an interaction is learned or reinforced.
+
+        :return: The current reinforcement time.
+        """
+        return self.reinforcement_time
+
+    def get_last_reinforced(self, interaction_):
+        """
+        Get the reinforcement time at which an interaction was last learned or
+        reinforced.
+
+        :param interaction_: The interaction.
+        :return: The reinforcement time, or 0 if the interaction is unknown.
+        """
+        if interaction_ in self.interaction_ids:
+            return self.reinforcement_table[self.interaction_ids[interaction_]]
+        else:
+            return 0
+
+    def evict_interactions(self, protected_interaction = None):
+        """
+        Evict composite interactions until the memory is below its capacity.
+        A batch of EVICTION_BATCH_FRACTION times the capacity is evicted at
+        once.
+
+        :param protected_interaction: Optional, an interaction that must not 
+                                      be evicted (e.g., the interaction that
+                                      was just learned).
+        """
+        count = len(self.composite_interactions) - self.capacity + int(self.capacity * self.EVICTION_BATCH_FRACTION)
+        candidates = (
+            composite for composite in self.composite_interactions
+            if composite is not protected_interaction
+        )
+        evicted = self.eviction_handler.select_evictions(self, candidates, count)
+        self.remove_composite_interactions(evicted)
+
+        self.eviction_count += len(evicted)
+        AppState.get_state().get_logger().info("Interaction memory full: evicted %s interactions (%s in total)" % (len(evicted), self.eviction_count))
+
+    def remove_composite_interactions(self, composites):
+        """
+        Remove composite interactions from the memory, together with their
+        weights, alternatives, and index and cache entries.
+
+        :param composites: The composite interactions to remove.
+        """
+        removed = set()
+        for composite in composites:
+            if composite not in self.composite_interactions:
+                continue
+            removed.add(composite)
+
+            self.composite_interactions.discard(composite)
+
+            pre = composite.get_pre()
+            self.composite_interactions_by_pre[pre].remove(composite)
+            if len(self.composite_interactions_by_pre[pre]) == 0:
+                del self.composite_interactions_by_pre[pre]
+
+            weight = self.weight_table[self.interaction_ids[composite]]
+            self.weight_sum -= weight
+            self.unregister_interaction(composite)
+            self.propagate_weight_change(composite, -weight)
+            self.untrack_hierarchy(composite)
+            self.uncache_valence(composite)
+            self.alternative_interactions.pop(composite, None)
+
+        if len(removed) > 0:
+            # Removed interactions can no longer be alternatives of others
+            for interaction_, alternatives in self.alternative_interactions.items():
+                if not removed.isdisjoint(alternatives):
+                    self.alternative_interactions[interaction_] = utilities.orderedset.OrderedSet(
+                        alternative for alternative in alternatives if alternative not in removed
+                    )
+
+    def track_hierarchy(self, interaction_):
+        """
+        Start maintaining the hierarchical weight of an interaction and of all
+        interactions in its hierarchy, and index the interaction as a parent of
+        its pre- and post-interaction.
+
+        :param interaction_: The interaction to track.
+        :return: The hierarchical weight of the interaction.
+        """
+        if interaction_ in self.hierarchical_weights:
+            return self.hierarchical_weights[interaction_]
+
+        if isinstance(interaction_, interaction.CompositeInteraction):
+            pre = interaction_.get_pre()
+            post = interaction_.get_post()
+            weight = (
+                self.get_weight(interaction_)
+                + self.track_hierarchy(pre)
+                + self.track_hierarchy(post)
+            )
+            self.parent_interactions.setdefault(pre, []).append(interaction_)
+            self.parent_interactions.setdefault(post, []).append(interaction_)
+        else:
+            weight = self.get_weight(interaction_)
+
+        self.hierarchical_weights[interaction_] = weight
+        return weight
+
+    def untrack_hierarchy(self, interaction_):
+        """
+        Stop maintaining the hierarchical weight of an interaction that is no
+        longer registered and is no longer part of the hierarchy of a tracked
+        interaction. Parts of its hierarchy for which this holds as well are
+        released too.
+
+        :param interaction_: The interaction to stop tracking.
+        """
+        stack = [interaction_]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node not in self.hierarchical_weights or self.retains_hierarchical_weight(node):
+                continue
+
+            del self.hierarchical_weights[node]
+            self.parent_interactions.pop(node, None)
+
+            if isinstance(node, interaction.CompositeInteraction):
+                for child in (node.get_pre(), node.get_post()):
+                    self.parent_interactions[child].remove(node)
+                    stack.append(child)
+
+    def retains_hierarchical_weight(self, interaction_):
+        """
+        Test whether the hierarchical weight of a tracked interaction must
+        still be maintained, i.e. whether it is registered or is part of the
+        hierarchy of another tracked interaction.
+
+        :param interaction_: The tracked interaction.
+        :return: True if the hierarchical weight must be maintained.
+        """
+        return interaction_ in self.interaction_ids or len(self.parent_interactions.get(interaction_, ())) > 0
+
+    def propagate_weight_change(self, interaction_, delta):
+        """
+        Update the hierarchical weights after the weight of an interaction
+        changed. The change is propagated to every tracked composite
+        interaction containing the interaction, once for each occurrence.
+
+        :param interaction_: The interaction whose weight changed.
+        :param delta: The change in weight.
+        """
+        if delta == 0 or interaction_ not in self.hierarchical_weights:
+            return
+
+        stack = [interaction_]
+        while len(stack) > 0:
+            node = stack.pop()
+            self.hierarchical_weights[node] += delta
+            stack.extend(self.parent_interactions.get(node, ()))
+
+    def get_hierarchical_weight(self, interaction_):
+        """
+        Get the hierarchical weight of an interaction: the sum of the weights
+        of all interactions in its hierarchy. E.g., for a composite interaction
+        <i1, i2> this is <i1, i2>.weight + hweight(i1) + hweight(i2).
+
+        The hierarchical weight of composite interactions in the memory is
+        maintained incrementally, so this is a constant-time lookup for them.
+
+        :param interaction_: The interaction to get the hierarchical weight of.
+        :return: The hierarchical weight.
+        """
+        if interaction_ in self.hierarchical_weights:
+            return self.hierarchical_weights[interaction_]
+        elif isinstance(interaction_, interaction.CompositeInteraction):
+            return (
+                self.get_weight(interaction_)
+                + self.get_hierarchical_weight(interaction_.get_pre())
+                + self.get_hierarchical_weight(interaction_.get_post())
+            )
+        else:
+            return self.get_weight(interaction_)
+
+    def get_eviction_count(self):
+        """
+        Get the total number of composite interactions evicted from this
+        memory.
+
+        :return: The number of evicted interactions.
+        """
+        return self.eviction_count
 
     def add_alternative_interaction(self, interaction_, alternative_interaction):
         """
@@ -51,14 +392,14 @@ class InteractionMemory(object):
         :return: True if the alternative was added, false if it was already registered to the interaction
         """
 
-        # Create alternative interaction list for this interaction if it does not yet exist
+        # Create alternative interaction set for this interaction if it does not yet exist
         if interaction_ not in self.alternative_interactions:
-            self.alternative_interactions[interaction_] = []
+            self.alternative_interactions[interaction_] = utilities.orderedset.OrderedSet()
 
-        # Add the alternative interaction to the list of alternatives for this interaction
-        # if it is not yet in the list of alternatives for this interaction
+        # Add the alternative interaction to the set of alternatives for this interaction
+        # if it is not yet in the set of alternatives for this interaction
         if alternative_interaction not in self.alternative_interactions[interaction_]:
-            self.alternative_interactions[interaction_].append(alternative_interaction)
+            self.alternative_interactions[interaction_].add(alternative_interaction)
             return True
         else:
             return False
@@ -72,28 +413,103 @@ class InteractionMemory(object):
         if not isinstance(interaction_, interaction.PrimitiveInteraction) and not isinstance(interaction_, interaction.PrimitivePerceptionInteraction):
             raise Exception("Expected a primitive interaction or primitive perception interaction")
 
-        if len(self.interaction_enaction_history) >= self.INTERACTION_ENACTION_HISTORY_SIZE:
-            self.interaction_enaction_history.pop(0)
+        # Slide the windows of the maintained history counts
+        name = self.get_history_name(interaction_)
+        for window_size, count in self.history_counts.iteritems():
+            if len(self.interaction_enaction_history) >= window_size:
+                leaving_name = self.get_history_name(self.interaction_enaction_history[-window_size])
+                n = count[leaving_name]
+                self.history_count_lengths[window_size] -= 2 * n - 1
+                if n == 1:
+                    del count[leaving_name]
+                else:
+                    count[leaving_name] = n - 1
+
+            n = count[name]
+            self.history_count_lengths[window_size] += 2 * n + 1
+            count[name] = n + 1
 
         self.interaction_enaction_history.append(interaction_)
+        self.history_counts_requested.clear()
 
     def get_interaction_history(self):
         """
         Get the interaction history.
 
         :return: The interaction history
+        :rtype: utilities.ringbuffer.RingBuffer
         """
         return self.interaction_enaction_history
 
+    def set_interaction_history_size(self, size):
+        """
+        Set the number of interactions kept in the interaction history. The
+        most recent interactions are kept.
+
+        :param size: The number of interactions to keep.
+        """
+        self.interaction_enaction_history = utilities.ringbuffer.RingBuffer(size, self.interaction_enaction_history[-size:])
+        self.history_counts = {}
+        self.history_count_lengths = {}
+        self.history_counts_requested = set()
+
+    def get_history_name(self, interaction_):
+        """
+        Get the name under which an interaction is counted in the interaction
+        history counts. Primitive perception interactions are counted by the
+        name of their primitive interaction.
+
+        :param interaction_: A primitive or primitive perception interaction
+        :return: The name of the (primitive) interaction
+        """
+        if isinstance(interaction_, interaction.PrimitivePerceptionInteraction):
+            interaction_ = interaction_.get_primitive_interaction()
+        return interaction_.get_name()
+
+    def get_interaction_history_count(self, window_size):
+        """
+        Get the number of occurrences of each primitive interaction name in 
+        the last window_size interactions of the interaction history, together
+        with the squared length of that count vector.
+
+        The count is maintained incrementally as interactions are added to the
+        history, from the first time it is requested for a window size. When
+        a new window size is requested, the counts of window sizes that have
+        not been requested since the last interaction was added to the 
+        history are no longer maintained. The count should not be modified.
+
+        :param window_size: The number of most recent interactions to count.
+                            It is capped to the size of the history.
+        :return: A tuple of a Counter mapping interaction names to their 
+                 frequency and the squared length of the Counter as a vector.
+        """
+        window_size = min(window_size, self.interaction_enaction_history.get_capacity())
+
+        if window_size not in self.history_counts:
+            for unused_window_size in set(self.history_counts) - self.history_counts_requested:
+                del self.history_counts[unused_window_size]
+                del self.history_count_lengths[unused_window_size]
+
+            count = collections.Counter()
+            for interaction_ in self.interaction_enaction_history[-window_size:]:
+                count[self.get_history_name(interaction_)] += 1
+
+            self.history_counts[window_size] = count
+            self.history_count_lengths[window_size] = sum(n**2 for n in count.itervalues())
+
+        self.history_counts_requested.add(window_size)
+        return (self.history_counts[window_size], self.history_count_lengths[window_size])
+
     def get_alternative_interactions(self, interaction_):
         """
         Get the alternative interactions for an interaction.
 
         :param interaction_: The interaction to get the alternatives for.
-        :return: A list of alternative interactions registered to an interaction.
+        :return: An ordered set of alternative interactions registered to an 
+                 interaction, or an empty tuple if it has none.
         """
         if interaction_ not in self.alternative_interactions:
-            return []
+            return ()
         else:
             return self.alternative_interactions[interaction_]
 
@@ -102,9 +518,28 @@ class InteractionMemory(object):
         Increment the weight of an interaction.
 
         :param interaction: The interaction to increment the weight of.
+        :return: The new weight of the interaction.
         """
-        self.weights[interaction] += 1
+        id_ = self.interaction_ids[interaction]
+        self.weight_table[id_] += 1
         self.weight_sum += 1
+        self.mark_reinforced(interaction)
+        self.propagate_weight_change(interaction, 1)
+        return self.weight_table[id_]
+
+    def reinforce_interaction(self, interaction_):
+        """
+        Learn a composite interaction with a weight of 1, or increment its 
+        weight if it is already known.
+
+        :param interaction_: The composite interaction to learn or reinforce.
+        :return: The new weight of the interaction.
+        """
+        if interaction_ not in self.get_composite_interactions():
+            self.add_interaction(interaction_)
+            return 1
+        else:
+            return self.increment_weight(interaction_)
 
     def set_weight(self, interaction, weight):
         """
@@ -113,8 +548,12 @@ class InteractionMemory(object):
         :param interaction: The interaction to set the weight of.
         :param weight: The value to set the interaction's weight to.
         """
-        self.weight_sum = self.weight_sum - self.weights[interaction] + weight
-        self.weights[interaction] = weight
+        id_ = self.interaction_ids[interaction]
+        delta = weight - self.weight_table[id_]
+        self.weight_sum += delta
+        self.weight_table[id_] = weight
+        self.mark_reinforced(interaction)
+        self.propagate_weight_change(interaction, delta)
 
     def get_weight(self, interaction):
         """
@@ -122,11 +561,29 @@ class InteractionMemory(object):
 
         :param interaction: The interaction to get the weight of.
         """
-        if interaction in self.weights:
-            return self.weights[interaction]
+        if interaction in self.interaction_ids:
+            return self.weight_table[self.interaction_ids[interaction]]
         else:
             return 0
 
+    def get_weights(self):
+        """
+        Get the weights of all registered interactions.
+
+        :return: A dictionary mapping interactions to their weights.
+        """
+        return {interaction_: self.weight_table[id_] for interaction_, id_ in self.interaction_ids.iteritems()}
+
+    def get_weights_of(self, interactions):
+        """
+        Get the weights of a sequence of interactions.
+
+        :param interactions: The interactions to get the weights of.
+        :return: A list of weights, in the order of the interactions.
+        """
+        ids = self.interaction_ids
+        return [self.weight_table[ids[interaction_]] if interaction_ in ids else 0 for interaction_ in interactions]
+
     def get_total_weight(self):
         """
         Get the sum of weights of all known interactions.
@@ -143,33 +600,182 @@ class InteractionMemory(object):
         :param valence: The value to set the interaction's valence to.
         """
         if isinstance(interaction_, interaction.PrimitiveInteraction):
-            self.valences[interaction_] = valence
+            id_ = self.register_interaction(interaction_)
+            if self.valence_table[id_] != valence:
+                self.invalidate_valence_cache(interaction_)
+            self.valence_table[id_] = valence
         else:
             raise TypeError("Expected interaction to be primitive.")
 
-    def get_valence(self, interaction_, process_boredom = False):
+    def get_valences(self):
         """
-        Get the valence of an interaction. If the interaction is a primative,
-        get its valence. If the interaction is composite, sum the valences
-        of its primitives.
+        Get the valences of all registered primitive interactions.
 
-        :param interaction_: The interaction to get the valence of.
+        :return: A dictionary mapping primitive interactions to their valences.
+        """
+        return {
+            interaction_: self.valence_table[id_] for interaction_, id_ in self.interaction_ids.iteritems()
+            if isinstance(interaction_, interaction.PrimitiveInteraction)
+        }
+
+    def invalidate_valence_cache(self, primitive_interaction):
+        """
+        Remove all cached composite valences that depend on the valence of a
+        primitive interaction. Called when the valence of that primitive
+        changes.
+
+        :param primitive_interaction: The primitive interaction whose valence
+                                      changed.
+        """
+        if primitive_interaction in self.valence_cache_dependents:
+            for composite in list(self.valence_cache_dependents[primitive_interaction]):
+                self.uncache_valence(composite)
+
+    def get_valence_primitives(self, composite):
+        """
+        Get the primitive interactions the valence of a composite interaction
+        depends on.
+
+        :param composite: The composite interaction.
+        :return: A set of primitive interactions.
+        """
+        return set(
+            primitive.get_primitive_interaction() if isinstance(primitive, interaction.PrimitivePerceptionInteraction) else primitive
+            for primitive in composite.unwrap()
+        )
+
+    def cache_valence(self, composite, valence):
+        """
+        Cache the valence of a composite interaction, and index it by the 
+        primitive interactions it depends on.
+
+        :param composite: The composite interaction.
+        :param valence: The valence of the composite interaction.
+        """
+        self.valence_cache[composite] = valence
+        for primitive in self.get_valence_primitives(composite):
+            self.valence_cache_dependents.setdefault(primitive, set()).add(composite)
+
+    def uncache_valence(self, composite):
+        """
+        Remove the cached valence of a composite interaction, if any.
+
+        :param composite: The composite interaction.
+        """
+        if composite not in self.valence_cache:
+            return
+
+        del self.valence_cache[composite]
+        for primitive in self.get_valence_primitives(composite):
+            dependents = self.valence_cache_dependents[primitive]
+            dependents.discard(composite)
+            if len(dependents) == 0:
+                del self.valence_cache_dependents[primitive]
+
+    def clear_valence_cache(self):
+        """
+        Remove all cached composite valences.
+        """
+        self.valence_cache.clear()
+        self.valence_cache_dependents.clear()
+
+    def calculate_valence(self, interaction_):
+        """
+        Calculate the (unmodified) valence of an interaction, without using
+        the valence cache. If the interaction is a primitive, get its valence.
+        If the interaction is composite, sum the valences of its primitives.
+
+        :param interaction_: The interaction to calculate the valence of.
+        :return: The valence of the interaction.
         """
         if isinstance(interaction_, interaction.PrimitiveInteraction):
-            valence = self.valences[interaction_]
+            return self.valence_table[self.interaction_ids[interaction_]]
         elif isinstance(interaction_, interaction.PrimitivePerceptionInteraction):
-            valence =  self.valences[interaction_.get_primitive_interaction()]
+            return self.valence_table[self.interaction_ids[interaction_.get_primitive_interaction()]]
         elif isinstance(interaction_, interaction.CompositeInteraction):
             primitives = interaction_.unwrap()
-            valence = reduce(lambda x, y: x + self.get_valence(y), primitives, 0)
+            return reduce(lambda x, y: x + self.calculate_valence(y), primitives, 0)
         else:
             raise TypeError("Expected interaction_ to be either primitive or composite.")
 
+    def get_valence(self, interaction_, process_boredom = False):
+        """
+        Get the valence of an interaction. If the interaction is a primative,
+        get its valence. If the interaction is composite, sum the valences
+        of its primitives.
+
+        Composite valences are cached until the valence of one of their
+        primitives changes.
+
+        :param interaction_: The interaction to get the valence of.
+        """
+        if isinstance(interaction_, interaction.CompositeInteraction):
+            if interaction_ in self.valence_cache:
+                self.valence_cache_hits += 1
+                valence = self.valence_cache[interaction_]
+            else:
+                self.valence_cache_misses += 1
+                valence = self.calculate_valence(interaction_)
+                self.cache_valence(interaction_, valence)
+        else:
+            valence = self.calculate_valence(interaction_)
+
         if process_boredom:
             return self.boredom_handler.process_boredom(self, interaction_, valence)
         else:
             return valence
 
+    def get_valences_of(self, interactions):
+        """
+        Get the (unmodified) valences of a sequence of interactions.
+
+        :param interactions: The interactions to get the valences of.
+        :return: A list of valences, in the order of the interactions.
+        """
+        return [self.get_valence(interaction_) for interaction_ in interactions]
+
+    def process_boredom(self, interactions, valences):
+        """
+        Modify the valences of a sequence of interactions to take boredom into
+        account.
+
+        :param interactions: The interactions to process boredom for.
+        :param valences: The unmodified valences of the interactions.
+        :return: A list of modified valences, in the order of the 
+                 interactions.
+        """
+        return self.boredom_handler.process_boredom_batch(self, interactions, valences)
+
+    def get_boredom_handler(self):
+        """
+        Get the boredom handler of this memory.
+
+        :return: The boredom handler.
+        :rtype: model.boredomhandler.BoredomHandler
+        """
+        return self.boredom_handler
+
+    def set_boredom_handler(self, boredom_handler):
+        """
+        Set the boredom handler of this memory.
+
+        :param boredom_handler: The boredom handler.
+        """
+        self.boredom_handler = boredom_handler
+
+    def get_valence_cache_statistics(self):
+        """
+        Get statistics on the use of the composite valence cache.
+
+        :return: A dictionary with the number of cache hits, cache misses and
+                 the number of cached valences.
+        """
+        return {
+            "hits": self.valence_cache_hits,
+            "misses": self.valence_cache_misses,
+            "size": len(self.valence_cache)
+        }
+
     def get_proclivity(self, interaction):
         """
         Get the proclivity of an interaction. Proclivity is defined as the 
@@ -183,10 +789,31 @@ class InteractionMemory(object):
         return self.primitive_interactions
 
     def get_composite_interactions(self):
+        """
+        Get the composite interactions known to this memory, in the order in
+        which they were learned. The returned collection supports O(1)
+        membership tests.
+
+        :return: An ordered set of composite interactions.
+        """
         return self.composite_interactions
 
+    def get_composite_interactions_with_pre(self, pre):
+        """
+        Get the known composite interactions that have a given interaction as
+        their pre-interaction.
+
+        :param pre: The pre-interaction.
+        :return: A list of composite interactions with the given
+                 pre-interaction, in the order in which they were learned.
+        """
+        if pre in self.composite_interactions_by_pre:
+            return self.composite_interactions_by_pre[pre]
+        else:
+            return []
+
     def get_all_interactions(self):
-        return self.primitive_interactions + self.composite_interactions
+        return self.get_primitive_interactions() + list(self.get_composite_interactions())
 
     def find_interaction_by_name_and_result(self, name, result = "Succeed"):
         interactions = self.get_primitive_interactions()
@@ -197,27 +824,477 @@ class InteractionMemory(object):
 
         return None
 
-    def to_json(self):
+    def iter_alternative_interactions(self):
+        """
+        Iterate over the interactions that have alternatives.
+
+        :return: An iterator of tuples of interactions and their sets of
+                 alternative interactions.
+        """
+        return self.alternative_interactions.iteritems()
+
+    def export_valence(self, valence):
+        """
+        Get the representation of a primitive valence in JSON exports.
+
+        :param valence: The valence.
+        :return: The JSON-encodable representation of the valence.
+        """
+        return valence
+
+    def iter_json_interactions(self, ids):
+        """
+        Iterate over the JSON records of all interactions referenced by this
+        memory. Every interaction is encoded once, after the interactions it
+        is made of, and refers to those by their index in the sequence of 
+        records:
+
+        - a primitive interaction as ``{"name": ..., "result": ...}``;
+        - a primitive perception interaction as 
+          ``{"interaction": index, "perception": ...}``, with percepts encoded
+          by their name;
+        - a composite interaction as ``{"pre": index, "post": index}``.
+
+        :param ids: A dictionary that is filled with the index of every 
+                    encoded interaction.
+        :return: An iterator of JSON-encodable records.
+        """
+        roots = [self.get_primitive_interactions(), self.get_composite_interactions(), self.interaction_ids, self.interaction_enaction_history]
+        for interaction_, alternatives in self.iter_alternative_interactions():
+            roots.append((interaction_,))
+            roots.append(alternatives)
+
+        for root in (interaction_ for interactions in roots for interaction_ in interactions):
+            if root in ids:
+                continue
+
+            # Post-order walk, such that parts are encoded before the whole
+            stack = [root]
+            while len(stack) > 0:
+                node = stack[-1]
+                if node in ids:
+                    stack.pop()
+                    continue
+
+                if isinstance(node, interaction.CompositeInteraction):
+                    children = (node.get_pre(), node.get_post())
+                elif isinstance(node, interaction.PrimitivePerceptionInteraction):
+                    children = (node.get_primitive_interaction(),)
+                else:
+                    children = ()
+
+                missing = [child for child in children if child not in ids]
+                if len(missing) > 0:
+                    stack.extend(missing)
+                    continue
+
+                stack.pop()
+                ids[node] = len(ids)
+                if isinstance(node, interaction.CompositeInteraction):
+                    yield {"pre": ids[node.get_pre()], "post": ids[node.get_post()]}
+                elif isinstance(node, interaction.PrimitivePerceptionInteraction):
+                    yield {"interaction": ids[node.get_primitive_interaction()], "perception": node.get_perception()}
+                else:
+                    yield {"name": node.get_name(), "result": node.get_result()}
+
+    def get_json_tables(self, ids):
+        """
+        Get the JSON encoding of the contents of this memory, with 
+        interactions referred to by their index in the interaction records.
+
+        :param ids: A dictionary mapping the interactions to their indices.
+        :return: A dictionary of JSON-encodable values.
+        """
         return {
-            "primitive_interactions": [repr(i) for i in self.primitive_interactions],
-            "composite_interactions": [repr(i) for i in self.composite_interactions],
-            "valences": {repr(key): value for key, value in self.valences.items()},
-            "weights": {repr(key): value for key, value in self.weights.items()},
-            "alternative_interactions": {repr(key): [repr(v) for v in value] for key, value in self.alternative_interactions.items()},
+            "primitive_interactions": [ids[i] for i in self.get_primitive_interactions()],
+            "composite_interactions": [ids[i] for i in self.get_composite_interactions()],
+            "valences": [[ids[key], self.export_valence(value)] for key, value in self.get_valences().iteritems()],
+            "weights": [[ids[key], value] for key, value in self.get_weights().iteritems()],
+            "alternative_interactions": [[ids[key], [ids[v] for v in value]] for key, value in self.iter_alternative_interactions()],
             "weight_sum": self.weight_sum,
             "boredom_handler": repr(type(self.boredom_handler)),
-            "interaction_enaction_history": [repr(i) for i in self.interaction_enaction_history]
+            "interaction_enaction_history": [ids[i] for i in self.interaction_enaction_history],
+            "valence_cache_statistics": self.get_valence_cache_statistics(),
+            "capacity": self.capacity,
+            "eviction_handler": repr(type(self.eviction_handler)),
+            "eviction_count": self.eviction_count
         }
 
+    def to_json(self):
+        ids = {}
+        d = {"interactions": list(self.iter_json_interactions(ids))}
+        d.update(self.get_json_tables(ids))
+        return d
+
+    def write_json(self, f):
+        """
+        Write the JSON encoding of this memory (see to_json) to a file. The
+        interaction records are written one by one, so that the encoding is
+        never held in memory as a whole.
+
+        :param f: The file to write to.
+        """
+        encoder = utilities.customjsonencoder.CustomJSONEncoder()
+        ids = {}
+
+        f.write('{"interactions": [')
+        for n, record in enumerate(self.iter_json_interactions(ids)):
+            if n > 0:
+                f.write(',')
+            f.write('\n')
+            f.write(encoder.encode(record))
+        f.write('\n]')
+
+        for key, value in sorted(self.get_json_tables(ids).items()):
+            f.write(',\n%s: %s' % (encoder.encode(key), encoder.encode(value)))
+        f.write('\n}')
+
+    def load_json(self, data):
+        """
+        Load the interactions, weights, alternatives and interaction history
+        of a JSON encoding (see to_json) into this memory. Valences are only
+        loaded if they are numeric. The encoding of interactions by their repr,
+        written by earlier versions, is not supported.
+
+        :param data: The decoded JSON encoding.
+        """
+        if "interactions" not in data:
+            raise ValueError("Expected a JSON encoding with interaction records; encodings of interactions by their repr cannot be loaded")
+
+        interactions = []
+        for record in data["interactions"]:
+            if "pre" in record:
+                interactions.append(interaction.get_composite_interaction(interactions[record["pre"]], interactions[record["post"]]))
+            elif "perception" in record:
+                perception = record["perception"]
+                if isinstance(perception, basestring):
+                    perception = percept.get_percept(str(perception))
+                interactions.append(interaction.get_primitive_perception_interaction(interactions[record["interaction"]], perception))
+            else:
+                interactions.append(interaction.get_primitive_interaction(str(record["name"]), str(record["result"])))
+
+        weights = {interactions[id_]: weight for id_, weight in data["weights"]}
+
+        for id_ in data["primitive_interactions"]:
+            interaction_ = interactions[id_]
+            if interaction_ not in self.get_primitive_interactions():
+                self.add_interaction(interaction_, weights.get(interaction_, 1))
+
+        for id_, valence in data["valences"]:
+            if isinstance(valence, numbers.Number):
+                self.set_valence(interactions[id_], valence)
+
+        for id_ in data["composite_interactions"]:
+            interaction_ = interactions[id_]
+            if interaction_ not in self.get_composite_interactions():
+                self.add_interaction(interaction_, weights[interaction_])
+            else:
+                self.set_weight(interaction_, weights[interaction_])
+
+        for id_, alternatives in data["alternative_interactions"]:
+            for alternative_id in alternatives:
+                self.add_alternative_interaction(interactions[id_], interactions[alternative_id])
+
+        for id_ in data["interaction_enaction_history"]:
+            self.add_interaction_to_history(interactions[id_])
+
+    def __setstate__(self, state):
+        if "interaction_ids" in state:
+            state.setdefault("history_counts_requested", set())
+            self.__dict__.update(state)
+        else:
+            # A memory pickled before the interaction tables were introduced
+            self.load_legacy_state(state)
+
+    def load_legacy_state(self, state):
+        """
+        Load the state of a memory pickled before the interaction tables were
+        introduced, in which weights and valences were stored in dictionaries.
+
+        :param state: The pickled state of the memory.
+        """
+        InteractionMemory.__init__(self, type(state["boredom_handler"]))
+        self.add_legacy_interactions(state)
+
+    def add_legacy_interactions(self, state):
+        """
+        Add the interactions, weights, valences, alternatives and interaction
+        history of the pickled state of a memory, as loaded by 
+        load_legacy_state, to this memory.
+
+        :param state: The pickled state of the memory.
+        """
+        for interaction_ in state["primitive_interactions"]:
+            self.add_interaction(interaction_.get_canonical(), state["weights"][interaction_])
+
+        for interaction_, valence in state["valences"].iteritems():
+            # The valences of primitive perception interactions were not used
+            if isinstance(interaction_, interaction.PrimitiveInteraction):
+                self.set_valence(interaction_.get_canonical(), valence)
+
+        for interaction_ in state["composite_interactions"]:
+            self.add_interaction(interaction_.get_canonical(), state["weights"][interaction_])
+
+        for interaction_, alternatives in state["alternative_interactions"].iteritems():
+            for alternative in alternatives:
+                self.add_alternative_interaction(interaction_.get_canonical(), alternative.get_canonical())
+
+        for interaction_ in state["interaction_enaction_history"]:
+            self.add_interaction_to_history(interaction_.get_canonical())
+
+class OverlayInteractionMemory(InteractionMemory):
+    """
+    An interaction memory layered on top of a shared base interaction memory.
+    The base memory holds what is common to a population of agents, such as 
+    the primitive interactions, their valences and optionally a pre-trained 
+    set of composite interactions. The overlay only stores what its agent has
+    learned itself: new interactions, and copies of the entries of base
+    interactions whose weight, valence or alternatives it changed.
+
+    The base memory is read, but never written to, by its overlays. It must
+    not be changed while overlays are using it.
+    """
+
+    def __init__(self, base, boredom_handler = model.boredomhandler.RepetitiveBoredomHandler, capacity = None, eviction_handler = model.evictionhandler.LowestWeightEvictionHandler):
+        """
+        :param base: The shared base interaction memory.
+        :param boredom_handler: The boredom handler to use, or the boredom 
+                                handler class to instantiate.
+        :param capacity: Optional, the maximum number of composite interactions
+                         to remember in addition to those of the base memory.
+                         If None, the memory is unbounded.
+        :param eviction_handler: The eviction handler class choosing which
+                                 composite interactions to forget when the
+                                 capacity is exceeded.
+        """
+        super(OverlayInteractionMemory, self).__init__(boredom_handler, capacity, eviction_handler)
+        self.base = base
+        self.weight_sum = base.get_total_weight()
+
+    def get_base(self):
+        """
+        Get the shared base interaction memory.
+
+        :return: The base interaction memory.
+        """
+        return self.base
+
+    def get_primitive_interactions(self):
+        """
+        Get the primitive interactions known to this memory: those of the base
+        memory followed by those learned in this overlay. The list of the base
+        memory is returned as is if the overlay has not learned any primitive 
+        interactions.
+
+        :return: A list of primitive interactions.
+        """
+        if len(self.primitive_interactions) == 0:
+            return self.base.get_primitive_interactions()
+        else:
+            return self.base.get_primitive_interactions() + self.primitive_interactions
+
+    def register_interaction(self, interaction_):
+        """
+        Get the id of an interaction in this overlay, assigning it a new id if 
+        it has not been registered in the overlay yet. The weight and valence
+        of an interaction known to the base memory are copied to the overlay.
+
+        :param interaction_: The interaction to register.
+        :return: The id of the interaction in this overlay.
+        """
+        if interaction_ in self.interaction_ids:
+            return self.interaction_ids[interaction_]
+
+        id_ = super(OverlayInteractionMemory, self).register_interaction(interaction_)
+        base_id = self.base.get_interaction_id(interaction_)
+        if base_id is not None:
+            self.weight_table[id_] = self.base.get_weight_table()[base_id]
+            self.valence_table[id_] = self.base.get_valence_table()[base_id]
+        return id_
+
+    def add_alternative_interaction(self, interaction_, alternative_interaction):
+        if interaction_ not in self.alternative_interactions:
+            base_alternatives = self.base.get_alternative_interactions(interaction_)
+            if len(base_alternatives) > 0:
+                self.alternative_interactions[interaction_] = utilities.orderedset.OrderedSet(base_alternatives)
+
+        return super(OverlayInteractionMemory, self).add_alternative_interaction(interaction_, alternative_interaction)
+
+    def get_alternative_interactions(self, interaction_):
+        if interaction_ in self.alternative_interactions:
+            return self.alternative_interactions[interaction_]
+        else:
+            return self.base.get_alternative_interactions(interaction_)
+
+    def increment_weight(self, interaction):
+        self.register_interaction(interaction)
+        return super(OverlayInteractionMemory, self).increment_weight(interaction)
+
+    def set_weight(self, interaction, weight):
+        self.register_interaction(interaction)
+        super(OverlayInteractionMemory, self).set_weight(interaction, weight)
+
+    def get_weight(self, interaction):
+        if interaction in self.interaction_ids:
+            return self.weight_table[self.interaction_ids[interaction]]
+        else:
+            return self.base.get_weight(interaction)
+
+    def get_weights(self):
+        weights = self.base.get_weights()
+        weights.update(super(OverlayInteractionMemory, self).get_weights())
+        return weights
+
+    def get_weights_of(self, interactions):
+        return [self.get_weight(interaction_) for interaction_ in interactions]
+
+    def track_hierarchy(self, interaction_):
+        if interaction_ not in self.hierarchical_weights and interaction_ in self.base.hierarchical_weights:
+            return self.base.hierarchical_weights[interaction_]
+        else:
+            return super(OverlayInteractionMemory, self).track_hierarchy(interaction_)
+
+    def retains_hierarchical_weight(self, interaction_):
+        return (
+            interaction_ in self.base.hierarchical_weights 
+            or super(OverlayInteractionMemory, self).retains_hierarchical_weight(interaction_)
+        )
+
+    def propagate_weight_change(self, interaction_, delta):
+        """
+        Update the hierarchical weights after the weight of an interaction
+        changed. The hierarchical weights of composite interactions of the 
+        base memory that are affected by the change are copied to the overlay.
+
+        :param interaction_: The interaction whose weight changed.
+        :param delta: The change in weight.
+        """
+        if delta == 0 or (interaction_ not in self.hierarchical_weights and interaction_ not in self.base.hierarchical_weights):
+            return
+
+        stack = [interaction_]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node not in self.hierarchical_weights:
+                self.hierarchical_weights[node] = self.base.hierarchical_weights[node]
+            self.hierarchical_weights[node] += delta
+            stack.extend(self.parent_interactions.get(node, ()))
+            stack.extend(self.base.parent_interactions.get(node, ()))
+
+    def get_hierarchical_weight(self, interaction_):
+        if interaction_ not in self.hierarchical_weights and interaction_ in self.base.hierarchical_weights:
+            return self.base.hierarchical_weights[interaction_]
+        else:
+            return super(OverlayInteractionMemory, self).get_hierarchical_weight(interaction_)
+
+    def get_valences(self):
+        valences = self.base.get_valences()
+        valences.update(super(OverlayInteractionMemory, self).get_valences())
+        return valences
+
+    def calculate_valence(self, interaction_):
+        if isinstance(interaction_, interaction.PrimitivePerceptionInteraction):
+            interaction_ = interaction_.get_primitive_interaction()
+
+        if isinstance(interaction_, interaction.PrimitiveInteraction) and interaction_ not in self.interaction_ids:
+            return self.base.calculate_valence(interaction_)
+        else:
+            return super(OverlayInteractionMemory, self).calculate_valence(interaction_)
+
+    def get_composite_interactions(self):
+        """
+        Get the composite interactions known to this memory: those of the base
+        memory followed by those learned in this overlay, in the order in 
+        which they were learned. The returned collection supports O(1)
+        membership tests.
+
+        :return: An ordered set view of composite interactions.
+        """
+        return utilities.orderedset.OrderedSetUnion(self.base.get_composite_interactions(), self.composite_interactions)
+
+    def get_composite_interactions_with_pre(self, pre):
+        base_composites = self.base.get_composite_interactions_with_pre(pre)
+        if pre in self.composite_interactions_by_pre:
+            return base_composites + self.composite_interactions_by_pre[pre]
+        else:
+            return base_composites
+
+    def iter_alternative_interactions(self):
+        for interaction_ in self.base.alternative_interactions:
+            if interaction_ not in self.alternative_interactions:
+                yield (interaction_, self.base.alternative_interactions[interaction_])
+        for item in self.alternative_interactions.iteritems():
+            yield item
+
 class HomeostaticInteractionMemory(InteractionMemory):
     """
     A homeostatic interaction's valence is a function of the agent's internal
     energy level. Thus, this interaction memory keeps track of the agent to be
     able to compute the valence.
+
+    The valence functions are evaluated once whenever the agent's homeostatic
+    state changes, and the resulting snapshot is stored in the valence table.
+    Composite valences are then calculated (and cached) as in the base class.
     """
-    def __init__(self, agent, boredom_handler = model.boredomhandler.RepetitiveBoredomHandler):
-        super(HomeostaticInteractionMemory, self).__init__(boredom_handler)
+    def __init__(self, agent, boredom_handler = model.boredomhandler.RepetitiveBoredomHandler, capacity = None, eviction_handler = model.evictionhandler.LowestWeightEvictionHandler):
+        super(HomeostaticInteractionMemory, self).__init__(boredom_handler, capacity, eviction_handler)
         self.agent = agent
+        self.valence_functions = {}
+        self.snapshot_version = None
+
+    def load_legacy_state(self, state):
+        HomeostaticInteractionMemory.__init__(self, state["agent"], type(state["boredom_handler"]))
+        self.add_legacy_interactions(state)
+
+    def add_interaction(self, interaction_, weight = 1, valence = 0):
+        super(HomeostaticInteractionMemory, self).add_interaction(interaction_, weight, valence)
+        if interaction_ in self.valence_functions:
+            # The valence table entry was overwritten
+            self.invalidate_valence_snapshot()
+
+    def set_valence(self, interaction_, valence):
+        """
+        Set the valence function of an interaction.
+
+        :param interaction_: The interaction to set the valence function of.
+        :param valence: A function mapping the agent to the interaction's
+                        valence.
+        """
+        if isinstance(interaction_, interaction.PrimitiveInteraction):
+            self.register_interaction(interaction_)
+            self.valence_functions[interaction_] = valence
+            self.invalidate_valence_snapshot()
+        else:
+            raise TypeError("Expected interaction to be primitive.")
+
+    def get_valences(self):
+        return dict(self.valence_functions)
+
+    def invalidate_valence_snapshot(self):
+        """
+        Force the valence functions to be evaluated again on the next valence
+        lookup.
+        """
+        self.snapshot_version = None
+
+    def update_valence_snapshot(self):
+        """
+        Evaluate the valence functions of the primitive interactions and store
+        the results in the valence table, if the agent's homeostatic state has
+        changed since the last evaluation.
+        """
+        version = self.agent.get_homeostasis_version()
+        if version == self.snapshot_version:
+            return
+
+        for interaction_, valence_function in self.valence_functions.iteritems():
+            self.valence_table[self.interaction_ids[interaction_]] = valence_function(self.agent)
+        self.clear_valence_cache()
+        self.snapshot_version = version
+
+    def calculate_valence(self, interaction_):
+        self.update_valence_snapshot()
+        return super(HomeostaticInteractionMemory, self).calculate_valence(interaction_)
 
     def get_valence(self, interaction_, process_boredom = False):
         """
@@ -229,25 +1306,10 @@ class HomeostaticInteractionMemory(InteractionMemory):
 
         :param interaction_: The interaction to get the valence of.
         """
-        if isinstance(interaction_, interaction.PrimitiveInteraction):
-            return self.valences[interaction_](self.agent)
-        elif isinstance(interaction_, interaction.PrimitivePerceptionInteraction):
-            return self.valences[interaction_.get_primitive_interaction()](self.agent)
-        elif isinstance(interaction_, interaction.CompositeInteraction):
-            primitives = interaction_.unwrap()
-            valence = reduce(lambda x, y: x + self.get_valence(y), primitives, 0)
-            return valence
-        else:
-            raise TypeError("Expected interaction_ to be either primitive or composite.")
-
-        if process_boredom:
-            return self.boredom_handler.process_boredom(self, interaction_, valence)
-        else:
-            return valence
+        self.update_valence_snapshot()
+        return super(HomeostaticInteractionMemory, self).get_valence(interaction_, process_boredom)
 
-    def to_json(self):
+    def export_valence(self, valence):
         import dill
 
-        d = super(HomeostaticInteractionMemory, self).to_json()
-        d['valences'] = {key: dill.source.getsource(value) for key, value in d['valences'].items()}
-        return d
+        return dill.source.getsource(valence)
@@ -0,0 +1,190 @@
+"""
+Module that holds a type-coded occupancy grid of the world, used to look up
+the contents of many lines of sight at once.
+"""
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class OccupancyGrid(object):
+    """
+    A snapshot of the cells occupied by perceivable entities. Each cell holds
+    the type code of the first perceivable entity in it (in world order) and
+    the type code of the second one, which is what an entity standing in that
+    cell perceives there. Type code 0 means nothing is perceived; type code i
+    refers to the i-th (1-based) entry of the entity types.
+
+    Cells are the spanning positions of entities. If all entities are on whole
+    cells, a point is in the cell it falls in, like in Entity.at. If NumPy is
+    available, the cells are also stored in dense arrays so the contents of 
+    rays can be looked up in bulk.
+    """
+
+    def __init__(self, entities, entity_types):
+        """
+        :param entities: The entities in the world, in world order.
+        :param entity_types: A list of tuples of entity types and their names.
+                             Entities are coded by the first type they are an
+                             instance of.
+        """
+        self.entity_types = entity_types
+        self.entity_index = {}
+        self.cells = {}
+        self.whole = True
+
+        for index, entity_ in enumerate(entities):
+            code = self.get_type_code(entity_)
+            if code == 0:
+                continue
+
+            self.entity_index[entity_] = index
+            for position in entity_.get_spanning_positions():
+                cell = position.get()
+                if cell[0] % 1 != 0 or cell[1] % 1 != 0:
+                    self.whole = False
+
+                if cell not in self.cells:
+                    # First entity, its code, and the code of the second entity
+                    self.cells[cell] = [index, code, 0]
+                elif self.cells[cell][2] == 0:
+                    self.cells[cell][2] = code
+
+        self.origin = None
+        if numpy is not None and self.whole and len(self.cells) > 0:
+            self.build_arrays()
+
+    def get_type_code(self, entity_):
+        """
+        Get the type code of an entity.
+
+        :param entity_: The entity.
+        :return: The 1-based index of the first entity type the entity is an
+                 instance of, or 0 if the entity is not perceivable.
+        """
+        for code, (type_, name) in enumerate(self.entity_types, 1):
+            if isinstance(entity_, type_):
+                return code
+        return 0
+
+    def is_whole(self):
+        """
+        Get whether all perceivable entities are on whole cells. Otherwise,
+        looking up the contents of points that are not on the entities' cells
+        is not supported.
+
+        :return: True if all perceivable entities are on whole cells.
+        """
+        return self.whole
+
+    def build_arrays(self):
+        """
+        Build the dense arrays of first entities, first codes and second codes
+        covering all occupied cells.
+        """
+        cells = self.cells.keys()
+        min_x = int(min(x for (x, y) in cells))
+        min_y = int(min(y for (x, y) in cells))
+        width = int(max(x for (x, y) in cells)) - min_x + 1
+        height = int(max(y for (x, y) in cells)) - min_y + 1
+
+        self.origin = (min_x, min_y)
+        self.first_entities = numpy.full((width, height), -1, dtype = numpy.int32)
+        self.first_codes = numpy.zeros((width, height), dtype = numpy.int8)
+        self.second_codes = numpy.zeros((width, height), dtype = numpy.int8)
+
+        for (x, y) in cells:
+            (index, first_code, second_code) = self.cells[(x, y)]
+            x = int(x) - min_x
+            y = int(y) - min_y
+            self.first_entities[x, y] = index
+            self.first_codes[x, y] = first_code
+            self.second_codes[x, y] = second_code
+
+    def get_contents(self, entity_, ray):
+        """
+        Get the type codes of the points in a ray, as perceived by an entity.
+        The entity itself is not perceived.
+
+        :param entity_: The perceiving entity.
+        :param ray: A sequence of (x, y) points.
+        :return: A list of type codes, one per point.
+        """
+        return [self.get_code(entity_, point) for point in ray]
+
+    def get_code(self, entity_, point):
+        """
+        Get the type code of the entity at a point, as perceived by an entity.
+        The entity itself is not perceived.
+
+        :param entity_: The perceiving entity.
+        :param point: The (x, y) point.
+        :return: The type code.
+        """
+        cell = (math.floor(point[0]), math.floor(point[1]))
+        if cell in self.cells:
+            (first_index, first_code, second_code) = self.cells[cell]
+            if first_index == self.entity_index.get(entity_, -1):
+                return second_code
+            else:
+                return first_code
+        else:
+            return 0
+
+    def get_contents_of_rays(self, entities, rays):
+        """
+        Get the type codes of the points in multiple rays, each perceived by an
+        entity. Rays of equal lengths are looked up in bulk if NumPy is 
+        available.
+
+        :param entities: The perceiving entities.
+        :param rays: The rays, one per entity.
+        :return: A list of sequences of type codes, one per ray.
+        """
+        if numpy is None or self.origin is None or len(entities) == 0 or len(set(len(ray) for ray in rays)) != 1:
+            return [self.get_contents(entity_, ray) for (entity_, ray) in zip(entities, rays)]
+
+        cells = numpy.floor(numpy.array(rays, dtype = numpy.float64))
+        xs = cells[:, :, 0].astype(numpy.int64) - self.origin[0]
+        ys = cells[:, :, 1].astype(numpy.int64) - self.origin[1]
+        inside = (xs >= 0) & (xs < self.first_codes.shape[0]) & (ys >= 0) & (ys < self.first_codes.shape[1])
+        xs = numpy.where(inside, xs, 0)
+        ys = numpy.where(inside, ys, 0)
+
+        indices = numpy.array([self.entity_index.get(entity_, -1) for entity_ in entities], dtype = numpy.int32)
+        own = self.first_entities[xs, ys] == indices[:, None]
+        codes = numpy.where(own, self.second_codes[xs, ys], self.first_codes[xs, ys])
+        codes = numpy.where(inside, codes, 0)
+
+        return list(codes)
+
+class WorldOccupancyGrid(OccupancyGrid):
+    """
+    An occupancy grid that looks the entities up in the position-entity map
+    of the world rather than in a snapshot. It is cheap to create, supports
+    entities that are not on whole cells, and perceives the entities found by
+    World.get_entities_at.
+    """
+
+    def __init__(self, world, entity_types):
+        """
+        :param world: The world.
+        :param entity_types: A list of tuples of entity types and their names.
+                             Entities are coded by the first type they are an
+                             instance of.
+        """
+        self.world = world
+        self.entity_types = entity_types
+        self.whole = True
+        self.origin = None
+
+    def get_code(self, entity_, point):
+        for other in self.world.get_entities_at(point):
+            if other is not entity_:
+                code = self.get_type_code(other)
+                if code != 0:
+                    return code
+        return 0
@@ -0,0 +1,94 @@
+"""
+Module that holds the percepts generated by perception handlers.
+
+Percepts are interned: get_percept returns one percept per name in the
+process, identified by a small integer code. Percepts are compared by
+identity, and their name is used in logs and JSON exports.
+"""
+
+class Percept(object):
+    """
+    A percept, consisting of a small integer code and a readable name.
+    Percepts should be obtained from get_percept.
+    """
+
+    def __init__(self, code, name):
+        """
+        :param code: The integer code of the percept.
+        :param name: The readable name of the percept.
+        """
+        self.code = code
+        self.name = name
+        self.hash = hash(name)
+
+    def get_code(self):
+        """
+        Get the integer code of this percept.
+
+        :return: The code.
+        :rtype: int
+        """
+        return self.code
+
+    def get_name(self):
+        """
+        Get the readable name of this percept.
+
+        :return: The name.
+        :rtype: basestring
+        """
+        return self.name
+
+    def to_json(self):
+        return self.name
+
+    def __reduce__(self):
+        return (get_percept, (self.name,))
+
+    def __eq__(self, other):
+        return self is other
+
+    def __ne__(self, other):
+        return self is not other
+
+    def __hash__(self):
+        return self.hash
+
+    def __repr__(self):
+        return "Percept(%r)" % self.name
+
+    def __str__(self):
+        return self.name
+
+
+_percepts = {}
+_percepts_by_code = []
+
+def get_percept(name):
+    """
+    Get the percept with the given name. The percept is created if it does not
+    exist yet.
+
+    :param name: The readable name of the percept.
+    :return: The percept.
+    :rtype: Percept
+    """
+    percept = _percepts.get(name)
+    if percept is None:
+        percept = Percept(len(_percepts_by_code), name)
+        _percepts[name] = percept
+        _percepts_by_code.append(percept)
+    return percept
+
+def get_percept_by_code(code):
+    """
+    Get the percept with the given code.
+
+    :param code: The integer code of the percept.
+    :return: The percept.
+    :rtype: Percept
+    """
+    return _percepts_by_code[code]
+
+#: The percept of perceiving nothing.
+EMPTY_PERCEPT = get_percept("")
@@ -3,9 +3,12 @@ Module that holds classes that represent an agent's perception handler.
 """
 
 import abc
+import math
 import entity
 import agent
 import structure
+import percept
+import occupancygrid
 
 class PerceptionHandler(object):
     """
@@ -20,6 +23,7 @@ class PerceptionHandler(object):
         :param agent: The agent to generate the percept for.
         :param world: The world to generate the percept for.
         :return: The percept.
+        :rtype: percept.Percept
         """
         raise NotImplementedError("Should be implemented by child")
 
@@ -29,89 +33,371 @@ class EmptyPerceptionHandler(PerceptionHandler):
     """
 
     def perceive(self, agent, world):
-        return ""
+        return percept.EMPTY_PERCEPT
 
-class BasicPerceptionHandler(PerceptionHandler):
+def _ray_offsets(length):
     """
-    A perception handler that perceives walls and blocks up to a given distance.
-    The perception indicates the type of structure that is seen, as well as its
-    distance.
+    Calculate the integer offsets of the cells in a line of sight, for each
+    rotation that is a multiple of 90 degrees.
+
+    :param length: The number of cells in the line of sight.
+    :return: A dictionary mapping rotations in degrees to tuples of (x, y)
+             offsets, nearest first.
+    """
+    offsets = {}
+    for rotation in [0, 90, 180, 270]:
+        angle = math.radians(rotation)
+        offsets[rotation] = tuple(
+            (int(round(delta * math.cos(angle))), int(round(-delta * math.sin(angle))))
+            for delta in range(0, length)
+        )
+    return offsets
+
+class GridPerceptionHandler(PerceptionHandler):
+    """
+    Abstract perception handler that perceives the world through an occupancy
+    grid. The world can share one grid between all agents perceiving the same
+    types of entities.
     """
 
+    #: The types of entities that are perceived, and their names
+    ENTITY_TYPES = [
+        (agent.Agent, "agent"),
+        (structure.Wall, "wall"),
+        (structure.Block, "block"),
+        (structure.Food, "food")
+    ]
+
     def perceive(self, agent_, world_):
-        for delta in range(0, 10):
-            pos = entity.Position(agent_.get_position())
+        return self.perceive_grid(agent_, occupancygrid.WorldOccupancyGrid(world_, self.ENTITY_TYPES))
+
+    @abc.abstractmethod
+    def perceive_grid(self, agent_, grid):
+        """
+        Generates a percept given an agent and an occupancy grid of the world.
+
+        :param agent_: The agent to generate the percept for.
+        :param grid: The occupancy grid of the world, built for ENTITY_TYPES.
+        :return: The percept.
+        :rtype: percept.Percept
+        """
+        raise NotImplementedError("Should be implemented by child")
+
+class RayPerceptionHandler(GridPerceptionHandler):
+    """
+    Abstract perception handler perceiving the first entity in the line of
+    sight of an agent, up to a given distance.
+    """
+
+    #: The number of cells in the line of sight (including the agent's own)
+    RAY_LENGTH = 10
+    #: The offsets of the line of sight for rotations that are multiples of
+    #: 90 degrees, for entities with a step size of 1
+    RAY_OFFSETS = _ray_offsets(RAY_LENGTH)
+
+    def get_ray(self, agent_):
+        """
+        Get the positions in the line of sight of an agent. The offsets of the
+        line of sight are looked up for agents on whole cells facing a rotation
+        that is a multiple of 90 degrees, and calculated otherwise.
+
+        :param agent_: The agent.
+        :return: A list of (x, y) positions, nearest first.
+        """
+        (x, y) = agent_.get_position().get()
+
+        offsets = None
+        if agent_.step_size == 1 and x % 1 == 0 and y % 1 == 0:
+            offsets = self.RAY_OFFSETS.get(agent_.get_rotation())
+
+        if offsets is not None:
+            return [(x + dx, y + dy) for (dx, dy) in offsets]
+        else:
+            ray = []
+            for delta in range(0, self.RAY_LENGTH):
+                (dx, dy) = agent_.get_move_delta(delta)
+                ray.append((entity.Position.round(x + dx), entity.Position.round(y + dy)))
+            return ray
 
-            pos.add(agent_.get_move_delta(delta))
+    def cast_ray(self, agent_, world_):
+        """
+        Find the first perceivable entity in the line of sight of an agent.
 
-            entities = world_.get_entities_at(pos)
-            for entity_ in entities:
-                if entity_ == agent_:
+        :param agent_: The agent.
+        :param world_: The world.
+        :return: A tuple of the name of the type of the entity and its
+                 distance, or None if no entity is perceived.
+        """
+        for delta, position in enumerate(self.get_ray(agent_)):
+            for entity_ in world_.get_entities_at(position):
+                if entity_ is agent_:
                     continue
-                if isinstance(entity_, agent.Agent):
-                    return "a%s" % delta
-                elif isinstance(entity_, structure.Wall):
-                    return "w%s" % delta
-                elif isinstance(entity_, structure.Block):
-                    return "b%s" % delta
-                elif isinstance(entity_, structure.Food):
-                    return "f%s" % delta
+                for (type_, name) in self.ENTITY_TYPES:
+                    if isinstance(entity_, type_):
+                        return (name, delta)
+
+        return None
+
+    def perceive(self, agent_, world_):
+        return self.perceive_cast(agent_, self.cast_ray(agent_, world_))
+
+    def perceive_grid(self, agent_, grid):
+        return self.perceive_ray_contents(agent_, grid.get_contents(agent_, self.get_ray(agent_)))
+
+    def perceive_ray_contents(self, agent_, contents):
+        """
+        Generates a percept given the precomputed contents of the line of sight
+        of an agent, as looked up in an occupancy grid of the world.
+
+        :param agent_: The agent to generate the percept for.
+        :param contents: A sequence of type codes per cell in the line of
+                         sight: 0 if nothing is perceived, or the 1-based
+                         index of the perceived type in ENTITY_TYPES.
+        :return: The percept.
+        :rtype: percept.Percept
+        """
+        for delta, code in enumerate(contents):
+            if code != 0:
+                return self.perceive_cast(agent_, (self.ENTITY_TYPES[code - 1][1], delta))
+
+        return self.perceive_cast(agent_, None)
+
+    @abc.abstractmethod
+    def perceive_cast(self, agent_, perception):
+        """
+        Generates a percept given the first entity in the line of sight of an
+        agent.
 
-        return ""
+        :param agent_: The agent to generate the percept for.
+        :param perception: A tuple of the name of the type of the entity and
+                           its distance, or None if no entity is perceived.
+        :return: The percept.
+        :rtype: percept.Percept
+        """
+        raise NotImplementedError("Should be implemented by child")
 
-class PersistentPerceptionHandler(PerceptionHandler):
+class BasicPerceptionHandler(RayPerceptionHandler):
     """
-    A perception handler that has a persistent perception. Perceives changes
-    in the line of sight: objects that appeared, got closer, further away, etc. 
+    A perception handler that perceives walls and blocks up to a given distance.
+    The perception indicates the type of structure that is seen, as well as its
+    distance.
     """
 
-    def __init__(self):
-        self.previous_perception = None
+    #: The percepts by type of perceived entity and distance
+    PERCEPTS = {
+        (name, delta): percept.get_percept("%s%s" % (name[0], delta)) 
+        for (type_, name) in GridPerceptionHandler.ENTITY_TYPES 
+        for delta in range(0, RayPerceptionHandler.RAY_LENGTH)
+    }
 
-    def perceive(self, agent_, world_):
+    def perceive_cast(self, agent_, perception):
+        if perception is None:
+            return percept.EMPTY_PERCEPT
+        else:
+            return self.PERCEPTS[perception]
 
-        perception = None
+class PersistentPerceptionHandler(RayPerceptionHandler):
+    """
+    A perception handler that has a persistent perception. Perceives changes
+    in the line of sight: objects that appeared, got closer, further away, etc. 
+    """
 
-        for delta in range(0, 10):
-            pos = entity.Position(agent_.get_position())
+    #: The percepts by type of perceived entity and change in the line of sight
+    PERCEPTS = {
+        (name, change): percept.get_percept("%s %s" % (name, change))
+        for (type_, name) in GridPerceptionHandler.ENTITY_TYPES
+        for change in ["on top", "in front", "got closer", "unchanged", "got further away", "appeared"]
+    }
 
-            pos.add(agent_.get_move_delta(delta))
+    def __init__(self):
+        self.previous_perception = None
 
-            entities = world_.get_entities_at(pos)
-            for entity_ in entities:
-                if entity_ == agent_:
-                    continue
-                if isinstance(entity_, agent.Agent):
-                    perception = ("agent", delta)
-                    break
-                elif isinstance(entity_, structure.Wall):
-                    perception = ("wall", delta)
-                    break
-                elif isinstance(entity_, structure.Block):
-                    perception = ("block", delta)
-                    break
-                elif isinstance(entity_, structure.Food):
-                    perception = ("food", delta)
-                    break
-            
-            if perception != None:
-                break
-          
+    def perceive_cast(self, agent_, perception):
         previous_perception = self.previous_perception
         self.previous_perception = perception
 
         if perception == None:
-            return ""  
+            return percept.EMPTY_PERCEPT
         elif perception[1] == 0:
-            return "%s on top" % perception[0]
+            return self.PERCEPTS[(perception[0], "on top")]
         elif perception[1] == 1:
-            return "%s in front" % perception[0]
+            return self.PERCEPTS[(perception[0], "in front")]
         elif previous_perception != None and perception[0] == previous_perception[0]:
             if perception[1] < previous_perception[1]:
-                return "%s got closer" % perception[0]
+                return self.PERCEPTS[(perception[0], "got closer")]
             elif perception[1] == previous_perception[1]:
-                return "%s unchanged" % perception[0]
+                return self.PERCEPTS[(perception[0], "unchanged")]
             else:
-                return "%s got further away" % perception[0]
+                return self.PERCEPTS[(perception[0], "got further away")]
         else:
-            return "%s appeared" % perception[0]
+            return self.PERCEPTS[(perception[0], "appeared")]
+
+class FieldOfViewPerceptionHandler(GridPerceptionHandler):
+    """
+    A perception handler that perceives the nearest entity in the field of
+    view of an agent. The field of view is a cone around the agent's rotation,
+    up to a given range. It is computed with recursive shadowcasting over an
+    occupancy grid, where every perceivable entity blocks the view behind it.
+
+    The percept names the type of the nearest entity, its (rounded) distance 
+    and whether it is to the left, ahead or to the right (the cone is divided
+    in three equal sectors), such as "wall 3 left". Entities in the agent's own
+    cell are perceived as, for example, "food on top".
+    """
+
+    #: Transformations from the coordinates of the first octant to the 
+    #: coordinates of each of the eight octants (xx, xy, yx, yy)
+    OCTANTS = [
+        (1, 0, 0, 1),
+        (0, 1, 1, 0),
+        (0, -1, 1, 0),
+        (-1, 0, 0, 1),
+        (-1, 0, 0, -1),
+        (0, -1, -1, 0),
+        (0, 1, -1, 0),
+        (1, 0, 0, -1)
+    ]
+
+    def __init__(self, range_ = 10, angle = 90):
+        """
+        :param range_: The maximum distance (in cells) at which entities are
+                       perceived.
+        :param angle: The angle of the cone of the field of view in degrees,
+                      centered on the agent's rotation (360 for all around).
+        """
+        self.range = range_
+        self.angle = angle
+        self.percepts = {}
+        for (type_, name) in self.ENTITY_TYPES:
+            self.percepts[(name, 0, None)] = percept.get_percept("%s on top" % name)
+            for distance in range(1, range_ + 1):
+                for side in ["left", "ahead", "right"]:
+                    self.percepts[(name, distance, side)] = percept.get_percept("%s %s %s" % (name, distance, side))
+
+    def get_range(self):
+        return self.range
+
+    def get_angle(self):
+        return self.angle
+
+    def get_relative_angle(self, agent_, dx, dy):
+        """
+        Get the angle of a cell offset relative to the rotation of an agent.
+
+        :param agent_: The agent.
+        :param dx: The offset of the cell along the x-axis.
+        :param dy: The offset of the cell along the y-axis.
+        :return: The angle in degrees in [-180, 180), positive to the left.
+        """
+        angle = math.degrees(math.atan2(-dy, dx))
+        return (angle - agent_.get_rotation() + 180) % 360 - 180
+
+    def get_visible_cells(self, agent_, grid):
+        """
+        Get the offsets of the cells in the field of view of an agent that hold
+        a perceivable entity.
+
+        :param agent_: The agent.
+        :param grid: The occupancy grid of the world.
+        :return: A list of tuples of the (dx, dy) offset of a cell and the type
+                 code of the entity in it.
+        """
+        (x, y) = agent_.get_position().get()
+        origin = (math.floor(x), math.floor(y))
+
+        visible = {}
+        for (xx, xy, yx, yy) in self.OCTANTS:
+            # Skip octants (45 degrees wide) that are outside the cone
+            if self.angle < 360 and abs(self.get_relative_angle(agent_, -0.5 * xx - xy, -0.5 * yx - yy)) > self.angle / 2.0 + 22.5:
+                continue
+            self.cast_light(agent_, grid, origin, visible, 1, 1.0, 0.0, (xx, xy, yx, yy))
+
+        cells = []
+        for (dx, dy), code in visible.iteritems():
+            if self.angle >= 360 or abs(self.get_relative_angle(agent_, dx, dy)) <= self.angle / 2.0:
+                cells.append(((dx, dy), code))
+        return cells
+
+    def cast_light(self, agent_, grid, origin, visible, row, start, end, octant):
+        """
+        Scan the rows of an octant from a given row, between a start and end
+        slope, recursing into the parts of the next rows that are not in the
+        shadow of the entities found.
+
+        :param agent_: The perceiving agent.
+        :param grid: The occupancy grid of the world.
+        :param origin: The cell of the agent.
+        :param visible: A dictionary mapping the offsets of the visible cells
+                        holding an entity to their type codes, updated in place.
+        :param row: The row to start scanning at.
+        :param start: The slope to start scanning at.
+        :param end: The slope to stop scanning at.
+        :param octant: The transformation of the octant.
+        """
+        if start < end:
+            return
+
+        (xx, xy, yx, yy) = octant
+        range_squared = self.range * self.range
+        new_start = start
+        for j in range(row, self.range + 1):
+            blocked = False
+            for i in range(-j, 1):
+                left_slope = (i - 0.5) / (-j + 0.5)
+                right_slope = (i + 0.5) / (-j - 0.5)
+                if start < right_slope:
+                    continue
+                elif end > left_slope:
+                    break
+
+                dx = i * xx - j * xy
+                dy = i * yx - j * yy
+                code = grid.get_code(agent_, (origin[0] + dx, origin[1] + dy))
+                if code != 0 and i * i + j * j <= range_squared:
+                    visible[(dx, dy)] = code
+
+                if blocked:
+                    if code != 0:
+                        new_start = right_slope
+                    else:
+                        blocked = False
+                        start = new_start
+                elif code != 0 and j < self.range:
+                    blocked = True
+                    self.cast_light(agent_, grid, origin, visible, j + 1, start, left_slope, octant)
+                    new_start = right_slope
+
+            if blocked:
+                break
+
+    def perceive_grid(self, agent_, grid):
+        (x, y) = agent_.get_position().get()
+        code = grid.get_code(agent_, (x, y))
+        if code != 0:
+            return self.percepts[(self.ENTITY_TYPES[code - 1][1], 0, None)]
+
+        nearest = None
+        for (dx, dy), code in self.get_visible_cells(agent_, grid):
+            distance = dx * dx + dy * dy
+            key = (distance, abs(self.get_relative_angle(agent_, dx, dy)), dx, dy)
+            if nearest is None or key < nearest[0]:
+                nearest = (key, dx, dy, code)
+
+        if nearest is None:
+            return percept.EMPTY_PERCEPT
+
+        (key, dx, dy, code) = nearest
+        relative_angle = self.get_relative_angle(agent_, dx, dy)
+        if self.angle >= 360:
+            sector = 120
+        else:
+            sector = self.angle / 3.0
+        if relative_angle > sector / 2.0:
+            side = "left"
+        elif relative_angle < -sector / 2.0:
+            side = "right"
+        else:
+            side = "ahead"
+
+        distance = min(self.range, max(1, int(round(math.sqrt(key[0])))))
+        return self.percepts[(self.ENTITY_TYPES[code - 1][1], distance, side)]
@@ -3,6 +3,7 @@ Module that holds classes that represent the world.
 """
 
 import abc
+import math
 import collections
 from random import shuffle
 import pygame
@@ -11,6 +12,8 @@ import appstate
 import events
 import interaction
 import agent
+import perceptionhandler
+import occupancygrid
 from entity import Position
 
 class World(events.EventListener):
@@ -24,9 +27,16 @@ class World(events.EventListener):
         self.complex_enact_logic = []
         self.width = 20
         self.height = 20
-        self.position_entity_map = False
         self.position_entity_map = {}
+        self.entity_order = {}
+        self.entity_counter = 0
         self.mutate_callbacks = []
+        self.entity_added_callbacks = []
+
+    def __setstate__(self, state):
+        state.setdefault("entity_added_callbacks", [])
+        self.__dict__.update(state)
+        self.build_position_entity_map()
 
     def get_entities_at(self, position):
         """
@@ -35,36 +45,85 @@ class World(events.EventListener):
         :param position: The position for which to get all entities
         :return: All entities at the given position
         """
-        if self.position_entity_map_valid:
-            if position in self.position_entity_map:
-                return self.position_entity_map[position]
-            else:
-                return []
+        cell = self.get_cell(position)
+        if cell in self.position_entity_map:
+            return [entity for entity in self.position_entity_map[cell] if entity.at(position)]
         else:
-            entities = []
+            return []
 
-            for entity in self.entities:
-                if entity.at(position):
-                    entities.append(entity)
+    def get_cell(self, position):
+        """
+        Get the cell of the position-entity map a position falls in.
+
+        :param position: The position, or an (x, y) tuple.
+        :return: The (x, y) cell.
+        """
+        if isinstance(position, Position):
+            position = position.get()
 
-            return entities
+        return (int(math.floor(position[0])), int(math.floor(position[1])))
 
-    def build_position_entity_map(self):
+    def get_entity_cells(self, entity):
         """
-        Builds the position-entity map. This is used for fast lookup of
-        entity positions.
+        Get the cells of the position-entity map covered by an entity.
+
+        :param entity: The entity.
+        :return: A list of (x, y) cells.
         """
-        self.position_entity_map.clear()
+        (x, y) = entity.get_position().get()
+        (min_x, min_y) = self.get_cell((x, y))
+        return [
+            (cell_x, cell_y)
+            for cell_x in range(min_x, int(math.ceil(x + entity.get_width())))
+            for cell_y in range(min_y, int(math.ceil(y + entity.get_height())))
+        ]
+
+    def index_entity(self, entity):
+        """
+        Add an entity to the position-entity map at its current position. 
+        Within a cell, entities are kept in the order they were added to the 
+        world.
 
-        for entity in self.entities:
-            positions = entity.get_spanning_positions()
-            for pos in positions:
-                if pos not in self.position_entity_map:
-                    self.position_entity_map[pos] = []
+        :param entity: The entity to add.
+        """
+        order = self.entity_order[entity]
+        for cell in self.get_entity_cells(entity):
+            if cell not in self.position_entity_map:
+                self.position_entity_map[cell] = [entity]
+            else:
+                entities = self.position_entity_map[cell]
+                index = len(entities)
+                while index > 0 and self.entity_order[entities[index - 1]] > order:
+                    index -= 1
+                entities.insert(index, entity)
 
-                self.position_entity_map[pos].append(entity)
+    def unindex_entity(self, entity):
+        """
+        Remove an entity from the position-entity map at its current position.
+
+        :param entity: The entity to remove.
+        """
+        for cell in self.get_entity_cells(entity):
+            entities = self.position_entity_map[cell]
+            entities.remove(entity)
+            if len(entities) == 0:
+                del self.position_entity_map[cell]
+
+    def build_position_entity_map(self):
+        """
+        Builds the position-entity map from scratch. The map is used for fast
+        lookup of entity positions, and is kept up to date as entities are 
+        added, removed and moved.
+        """
+        self.position_entity_map = {}
+        self.entity_order = {}
+        self.entity_counter = 0
 
-        self.position_entity_map_valid = True 
+        for entity in self.entities:
+            entity.set_world(self)
+            self.entity_order[entity] = self.entity_counter
+            self.entity_counter += 1
+            self.index_entity(entity)
 
     def get_entities_in_front(self, entity):
         """
@@ -180,6 +239,13 @@ class World(events.EventListener):
         """
         self.mutate_callbacks.append(callback)
 
+    def add_entity_added_callback(self, callback):
+        """
+        Add a callback to be called whenever an entity is added to the world.
+        The callback receives the world and the added entity.
+        """
+        self.entity_added_callbacks.append(callback)
+
     def get_width(self):
         return self.width
 
@@ -217,9 +283,19 @@ class World(events.EventListener):
 
     def add_entity(self, entity):
         self.entities.append(entity)
+        entity.set_world(self)
+        self.entity_order[entity] = self.entity_counter
+        self.entity_counter += 1
+        self.index_entity(entity)
+
+        for callback in self.entity_added_callbacks:
+            callback(self, entity)
 
     def remove_entity(self, entity):
         self.entities.remove(entity)
+        self.unindex_entity(entity)
+        del self.entity_order[entity]
+        entity.set_world(None)
 
     def prepare(self, agents):
         """
@@ -300,28 +376,70 @@ class World(events.EventListener):
             # Tell agent which interaction was enacted
             enacted[agent_] = enacted_interaction
 
+        # Get the percepts of all agents that have a perception handler, and
+        # of which the enacted interaction is not yet a primitive perception
+        # interaction
+        percepts = self.perceive([
+            agent_ for agent_ in agents_data 
+            if agent_.has_perception_handler() and not isinstance(enacted[agent_], interaction.PrimitivePerceptionInteraction)
+        ])
+
         # Notify agents of which interaction was enacted
         for agent_, (primitive_interaction, data) in agents_data.iteritems():
-            if agent_.has_perception_handler() and not isinstance(enacted[agent_], interaction.PrimitivePerceptionInteraction):
-                # The agent has a perception handler, and the enacted 
-                # interaction is not yet a primitive perception interaction, so
-                # get and add the percept
-                agent_.enacted_interaction(interaction.PrimitivePerceptionInteraction(enacted[agent_], agent_.get_perception(self)), data)
+            if agent_ in percepts:
+                agent_.enacted_interaction(interaction.get_primitive_perception_interaction(enacted[agent_], percepts[agent_]), data)
             else:
                 agent_.enacted_interaction(enacted[agent_], data)
 
+    def perceive(self, agents):
+        """
+        Get the percepts of multiple agents in one pass. Agents with a 
+        perception handler perceiving through an occupancy grid share a grid
+        of the world, and agents looking along a line of sight receive the 
+        precomputed contents of their line of sight. If some entities are not
+        on whole cells, the grid looks the entities up in the position-entity
+        map of the world instead. Other agents perceive the world directly.
+
+        :param agents: The agents to get the percepts of.
+        :return: A dictionary mapping agents to their percepts.
+        """
+        percepts = {}
+        grid_agents = collections.defaultdict(list)
+
+        for agent_ in agents:
+            handler = agent_.get_perception_handler()
+            if isinstance(handler, perceptionhandler.GridPerceptionHandler):
+                grid_agents[tuple(handler.ENTITY_TYPES)].append(agent_)
+            else:
+                percepts[agent_] = agent_.get_perception(self)
+
+        for entity_types, agents_ in grid_agents.iteritems():
+            grid = occupancygrid.OccupancyGrid(self.entities, entity_types)
+            if not grid.is_whole():
+                # Look the entities up in the position-entity map instead
+                grid = occupancygrid.WorldOccupancyGrid(self, entity_types)
+
+            ray_agents = []
+            for agent_ in agents_:
+                if isinstance(agent_.get_perception_handler(), perceptionhandler.RayPerceptionHandler):
+                    ray_agents.append(agent_)
+                else:
+                    percepts[agent_] = agent_.get_perception_handler().perceive_grid(agent_, grid)
+
+            rays = [agent_.get_perception_handler().get_ray(agent_) for agent_ in ray_agents]
+            contents = grid.get_contents_of_rays(ray_agents, rays)
+            for agent_, contents_ in zip(ray_agents, contents):
+                percepts[agent_] = agent_.get_perception_handler().perceive_ray_contents(agent_, contents_)
+
+        return percepts
+
     def notify(self, event):
         if isinstance(event, events.TickEvent):
             # Call all mutate callbacks
             t = appstate.AppState.get_state().get_t()
             for mutate_callback in self.mutate_callbacks:
-                # Build the position entity map to make entity_at lookup quick
-                self.build_position_entity_map()
                 mutate_callback(self, t)
 
-            # Build the position entity map to make entity_at lookup quick
-            self.build_position_entity_map()
-
             agents = []
             for entity in self.entities:
                 if isinstance(entity, agent.Agent):
@@ -329,9 +447,4 @@ class World(events.EventListener):
             shuffle(agents)
 
             agents_data = self.prepare(agents)
-            
-            # Agents will now enact in (and mutate) the world, so invalidate
-            # the entity map
-            self.position_entity_map_valid = False
-
             self.enact(agents_data)
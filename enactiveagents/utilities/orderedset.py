@@ -0,0 +1,91 @@
+"""
+Module containing an insertion-ordered set.
+"""
+
+import collections
+
+class OrderedSet(collections.MutableSet):
+    """
+    A set that remembers the order in which elements were added. Membership
+    tests, additions and removals are O(1), and iteration yields the elements
+    in insertion order.
+    """
+
+    def __init__(self, iterable = None):
+        """
+        :param iterable: Optional, the elements to initialize the set with.
+        """
+        self.elements = collections.OrderedDict()
+        if iterable is not None:
+            for element in iterable:
+                self.add(element)
+
+    def add(self, element):
+        """
+        Add an element to the set. Adding an element that is already in the
+        set does not change its position.
+
+        :param element: The element to add.
+        """
+        if element not in self.elements:
+            self.elements[element] = None
+
+    def discard(self, element):
+        """
+        Remove an element from the set if it is present.
+
+        :param element: The element to remove.
+        """
+        if element in self.elements:
+            del self.elements[element]
+
+    def __contains__(self, element):
+        return element in self.elements
+
+    def __iter__(self):
+        return iter(self.elements)
+
+    def __reversed__(self):
+        return reversed(self.elements)
+
+    def __len__(self):
+        return len(self.elements)
+
+    def __repr__(self):
+        return "OrderedSet(%r)" % list(self.elements)
+
+    def to_json(self):
+        return list(self.elements)
+
+class OrderedSetUnion(collections.Set):
+    """
+    A read-only view of the union of disjoint sets. Membership tests are O(1)
+    for every underlying set, and iteration yields the elements of the sets
+    one set after the other.
+    """
+
+    def __init__(self, *sets):
+        """
+        :param sets: The disjoint sets to view the union of.
+        """
+        self.sets = sets
+
+    def __contains__(self, element):
+        for set_ in self.sets:
+            if element in set_:
+                return True
+        return False
+
+    def __iter__(self):
+        for set_ in self.sets:
+            for element in set_:
+                yield element
+
+    def __len__(self):
+        return sum(len(set_) for set_ in self.sets)
+
+    def __repr__(self):
+        return "OrderedSetUnion(%r)" % list(self)
+
+    def to_json(self):
+        return list(self)
@@ -0,0 +1,104 @@
+"""
+Module containing a fixed-capacity ring buffer.
+"""
+
+import collections
+
+class RingBuffer(collections.Sequence):
+    """
+    A sequence holding at most a fixed number of elements. Once the buffer is
+    full, appending an element drops the oldest element. Appending and
+    indexing (from either end) are O(1).
+    """
+
+    def __init__(self, capacity, iterable = None):
+        """
+        :param capacity: The maximum number of elements in the buffer.
+        :param iterable: Optional, the elements to initialize the buffer with.
+                         If there are more than capacity elements, only the
+                         last capacity elements are kept.
+        """
+        if capacity < 1:
+            raise ValueError("Expected the capacity to be at least 1")
+
+        self.capacity = capacity
+        self.elements = []
+        self.start = 0
+        if iterable is not None:
+            for element in iterable:
+                self.append(element)
+
+    def get_capacity(self):
+        """
+        Get the maximum number of elements in the buffer.
+
+        :return: The capacity of the buffer.
+        """
+        return self.capacity
+
+    def append(self, element):
+        """
+        Append an element to the buffer, dropping the oldest element if the
+        buffer is full.
+
+        :param element: The element to append.
+        :return: The dropped element, or None if no element was dropped.
+        """
+        if len(self.elements) < self.capacity:
+            self.elements.append(element)
+            return None
+        else:
+            dropped = self.elements[self.start]
+            self.elements[self.start] = element
+            self.start = (self.start + 1) % self.capacity
+            return dropped
+
+    def clear(self):
+        """
+        Remove all elements from the buffer.
+        """
+        self.elements = []
+        self.start = 0
+
+    def __getitem__(self, index):
+        """
+        Get an element, or a list of elements if index is a slice. Slices are
+        copies of the selected elements.
+        """
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self.elements)))]
+
+        length = len(self.elements)
+        if index < 0:
+            index += length
+        if index < 0 or index >= length:
+            raise IndexError("RingBuffer index out of range")
+
+        return self.elements[(self.start + index) % length]
+
+    def __setitem__(self, index, element):
+        """
+        Replace an element.
+        """
+        length = len(self.elements)
+        if index < 0:
+            index += length
+        if index < 0 or index >= length:
+            raise IndexError("RingBuffer index out of range")
+
+        self.elements[(self.start + index) % length] = element
+
+    def __iter__(self):
+        for i in xrange(self.start, len(self.elements)):
+            yield self.elements[i]
+        for i in xrange(0, self.start):
+            yield self.elements[i]
+
+    def __len__(self):
+        return len(self.elements)
+
+    def __repr__(self):
+        return "RingBuffer(%r, %r)" % (self.capacity, list(self))
+
+    def to_json(self):
+        return list(self)
@@ -5,14 +5,20 @@ Prints a history of agent events to file.
 import events
 import json
 import utilities.customjsonencoder
+import utilities.ringbuffer
 
 class AgentEvents(events.EventListener):
     """
     View class
     """
 
-    def __init__(self):
+    def __init__(self, trace_size = 20):
+        """
+        :param trace_size: The number of most recent prepared and enacted
+                           interactions kept per agent.
+        """
         self.history = {}
+        self.trace_size = trace_size
 
     def create_if_not_exists(self, agent):
         """
@@ -21,24 +27,21 @@ class AgentEvents(events.EventListener):
         :param agent: The agent to add to the history
         """
         if str(agent) not in self.history:
-            self.history[str(agent)] = {"preparation": [], "enaction": []}
+            self.history[str(agent)] = {
+                "preparation": utilities.ringbuffer.RingBuffer(self.trace_size), 
+                "enaction": utilities.ringbuffer.RingBuffer(self.trace_size)
+            }
 
     def notify(self, event):
         if isinstance(event, events.AgentPreparationEvent):
             self.create_if_not_exists(event.agent)
 
             self.history[str(event.agent)]["preparation"].append((event.action, event.valence))
-
-            if len(self.history[str(event.agent)]["preparation"]) > 20:
-                self.history[str(event.agent)]["preparation"].pop(0)
         elif isinstance(event, events.AgentEnactionEvent):
             self.create_if_not_exists(event.agent)
 
             self.history[str(event.agent)]["enaction"].append((event.action, event.valence))
 
-            if len(self.history[str(event.agent)]["enaction"]) > 20:
-                self.history[str(event.agent)]["enaction"].pop(0)
-
     def write(self, fp):
         """
         Writes the view as json to a stream.